@@ -6,6 +6,7 @@ from typing import List
 
 from core.database import get_db
 from core.models import Clients, Consents, PyConsentType
+from agent_service.client_state import invalidate_client_state
 from agent_service.schemas import ClientBase, ClientResponse, ConsentRequest, ConsentResponse
 
 router = APIRouter(prefix='/api/v1/crm', tags=['CRM / LGPD'])
@@ -61,6 +62,11 @@ async def record_consent(
     session.add(new_consent)
     await session.commit()
     await session.refresh(new_consent)
+
+    # O estado de consentimento em cache deste cliente deixou de valer
+    client = await session.get(Clients, consent_data.client_id)
+    if client:
+        invalidate_client_state(client.whatsapp_id)
     
     return new_consent
 
@@ -1,17 +1,39 @@
-from fastapi import APIRouter, Depends, BackgroundTasks
+from fastapi import APIRouter, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
 import httpx
 import os
+import asyncio
 import logging
-from typing import List
-import openai
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
 
-from core.database import get_db
-from core.models import Clients, Consents, RagDocuments1536, Tickets, PyConsentType, PyTicketStatus
-from agent_service.schemas import EvoApiPayload
-from agent_service.llm_client import get_resilient_chat_completion
-from pgvector.sqlalchemy import Vector
+from core.config import (
+    RAG_TOP_K, RAG_MAX_DISTANCE, RAG_CONTEXT_TOKEN_BUDGET, WHATSAPP_RAG_NAMESPACE,
+    WHATSAPP_STREAMING_ENABLED, SEMANTIC_ANSWER_CACHE_ENABLED,
+)
+from core.answer_cache import lookup_cached_answer, store_answer
+from core.database import AsyncSessionFactory
+from core.embedding_cache import content_hash
+from core.http_clients import get_http_client
+from core.models import Consents, Tickets, PyConsentType, PyTicketStatus
+from retrieval.service import RetrievalOptions, retrieve
+from retrieval.query_embedding import get_query_embedding
+from agent_service.schemas import EvoApiPayload, EvoApiMessage, EvoApiMessageBody
+from agent_service.llm_client import (
+    get_resilient_chat_completion,
+    stream_resilient_chat_completion,
+    get_llm_provider_stats,
+    LLMStreamInterrupted,
+    LLM_UNAVAILABLE_MESSAGE,
+)
+from agent_service.sentence_stream import iter_sentence_messages
+from agent_service.prompt_builder import build_rag_prompt, RagPrompt
+from agent_service.intent_classifier import classify_intent, get_intent_stats
+from agent_service.conversation_executor import ConversationExecutor, ConversationQueueFull
+from agent_service.client_state import (
+    ClientState, load_client_state, has_cached_consent, invalidate_client_state, get_client_state_cache_stats,
+)
 
 # Configuração do logger
 log = logging.getLogger(__name__)
@@ -19,34 +41,6 @@ log = logging.getLogger(__name__)
 router = APIRouter(prefix='/webhook', tags=['Agent Orchestrator'])
 
 
-async def get_query_embedding(text: str) -> list[float]:
-    """
-    Gera embedding para a query usando a API da OpenAI
-    """
-    openai_api_key = os.getenv("OPENAI_API_KEY")
-    if not openai_api_key:
-        raise Exception("OPENAI_API_KEY não encontrada nas variáveis de ambiente")
-    
-    client = openai.AsyncOpenAI(api_key=openai_api_key)
-    
-    response = await client.embeddings.create(
-        input=text,
-        model="text-embedding-3-small"
-    )
-    
-    return response.data[0].embedding
-
-
-async def get_user_intent(query: str) -> str:
-    """
-    Classifica a intenção do usuário como 'PERGUNTA_RAG' ou 'PEDIDO_SUPORTE'
-    """
-    system_prompt = "Você é um classificador. A mensagem do usuário é uma PERGUNTA_RAG ou um PEDIDO_SUPORTE? Responda *apenas* com o nome da classe."
-    
-    intent = await get_resilient_chat_completion(system_prompt, query)
-    return intent.strip()
-
-
 async def send_response_to_evoapi(whatsapp_id: str, response_text: str):
     """
     Envia a resposta de volta para a EVOAPI
@@ -62,122 +56,353 @@ async def send_response_to_evoapi(whatsapp_id: str, response_text: str):
         "message": response_text
     }
     
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.post(evoapi_url, json=payload)
-            response.raise_for_status()
-            log.info(f"Resposta enviada para {whatsapp_id}: {response_text}")
-        except httpx.HTTPStatusError as e:
-            log.error(f"Erro ao enviar resposta para {whatsapp_id}: {e}")
-        except Exception as e:
-            log.error(f"Erro inesperado ao enviar resposta para {whatsapp_id}: {e}")
+    client = get_http_client("evoapi")
+    try:
+        response = await client.post(evoapi_url, json=payload)
+        response.raise_for_status()
+        log.info(f"Resposta enviada para {whatsapp_id}: {response_text}")
+    except httpx.HTTPStatusError as e:
+        log.error(f"Erro ao enviar resposta para {whatsapp_id}: {e}")
+    except Exception as e:
+        log.error(f"Erro inesperado ao enviar resposta para {whatsapp_id}: {e}")
+
+
+# Métricas agregadas dos turnos de conversa (para monitoramento)
+_turn_stats = {
+    "turns": 0,
+    "speculative_embeddings": 0,
+    "speculative_embeddings_cancelled": 0,
+    "stage_counts": {},
+    "total_ms": {},
+    "prompts": 0,
+    "prompt_tokens": 0,
+    "max_prompt_tokens": 0,
+    "chunks_truncated": 0,
+    "chunks_deduplicated": 0,
+    "chunks_over_budget": 0,
+}
+
+
+@contextmanager
+def _timed(timings: Dict[str, float], stage: str):
+    """
+    Registra a duração (ms) de uma etapa do turno
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = (time.perf_counter() - started) * 1000
+
+
+async def _speculative_query_embedding(query: str, timings: Dict[str, float]) -> List[float]:
+    """
+    Embedding da query calculado em paralelo à classificação de intenção.
+    Usa sessão própria, pois a sessão do turno não aceita operações concorrentes.
+    """
+    with _timed(timings, "embedding"):
+        async with AsyncSessionFactory() as embedding_session:
+            query_vector = await get_query_embedding(query, embedding_session)
+            await embedding_session.commit()
+    return query_vector
+
+
+async def _cancel_speculative(task: asyncio.Task) -> None:
+    """
+    Cancela o embedding especulativo quando o resultado não será usado
+    """
+    if not task.done():
+        task.cancel()
+        _turn_stats["speculative_embeddings_cancelled"] += 1
+    try:
+        await task
+    except (asyncio.CancelledError, Exception):
+        pass
+
+
+def _record_prompt(prompt: RagPrompt) -> None:
+    _turn_stats["prompts"] += 1
+    _turn_stats["prompt_tokens"] += prompt.prompt_tokens
+    _turn_stats["max_prompt_tokens"] = max(_turn_stats["max_prompt_tokens"], prompt.prompt_tokens)
+    _turn_stats["chunks_truncated"] += prompt.chunks_truncated
+    _turn_stats["chunks_deduplicated"] += prompt.chunks_deduplicated
+    _turn_stats["chunks_over_budget"] += prompt.chunks_over_budget
+
+
+def _record_turn(timings: Dict[str, float]) -> None:
+    _turn_stats["turns"] += 1
+    for stage, elapsed in timings.items():
+        _turn_stats["stage_counts"][stage] = _turn_stats["stage_counts"].get(stage, 0) + 1
+        _turn_stats["total_ms"][stage] = _turn_stats["total_ms"].get(stage, 0.0) + elapsed
 
 
 async def process_conversation(payload: EvoApiPayload, session: AsyncSession):
     """
-    Processa a conversação completa: LGPD -> Classificação de Intenção -> RAG ou Tickets
+    Processa a conversação completa: LGPD -> Classificação de Intenção -> RAG ou Tickets.
+
+    O texto do usuário só sai do sistema (embedding na OpenAI, caches) depois de
+    confirmado o consentimento: a partir daí, o embedding da query é calculado em
+    paralelo à classificação de intenção e aproveitado pela classificação por
+    centróides, pelo cache semântico e pelo retrieval. Se o turno não precisar
+    dele (pedido de suporte, fallback ou erro), é cancelado.
     """
     whatsapp_id = payload.sender.id
     user_query = payload.message.body.text
-    
-    # Etapa CRM (Find/Create)
-    stmt = select(Clients).filter(Clients.whatsapp_id == whatsapp_id)
-    result = await session.execute(stmt)
-    client = result.scalar_one_or_none()
-    
-    if not client:
-        client = Clients(whatsapp_id=whatsapp_id)
-        session.add(client)
-        await session.commit()
-        await session.refresh(client)
-    
-    # Etapa LGPD (Verificar consentimento)
-    stmt = select(Consents).filter(
-        Consents.client_id == client.id,
-        Consents.consent_type == PyConsentType.LGPD_V1,
-        Consents.is_given == True
-    )
-    result = await session.execute(stmt)
-    consent_given = result.scalar_one_or_none()
-    
+    timings: Dict[str, float] = {}
+    started = time.perf_counter()
+
+    response_text = await _run_conversation_stages(session, whatsapp_id, user_query, timings)
+
+    # Etapa Resposta: Enviar resposta para EVOAPI (None = já enviada em streaming)
+    if response_text is not None:
+        with _timed(timings, "send"):
+            await send_response_to_evoapi(whatsapp_id, response_text)
+
+    timings["total"] = (time.perf_counter() - started) * 1000
+    _record_turn(timings)
+    log.info(f"Turno de {whatsapp_id} concluído: " + ", ".join(f"{stage}={elapsed:.1f}ms" for stage, elapsed in timings.items()))
+
+
+async def _stream_answer_to_evoapi(whatsapp_id: str, prompt: RagPrompt, timings: Dict[str, float]) -> Tuple[str, bool]:
+    """
+    Gera a resposta em streaming e envia cada grupo de frases completas à EVOAPI
+    assim que fica pronto. Retorna o texto enviado e se a geração terminou sem falhas.
+    """
+    started = time.perf_counter()
+    messages = []
+    complete = True
+    try:
+        stream = stream_resilient_chat_completion(prompt.system_prompt, prompt.user_prompt)
+        async for message in iter_sentence_messages(stream):
+            if not messages:
+                timings["first_message"] = (time.perf_counter() - started) * 1000
+            messages.append(message)
+            await send_response_to_evoapi(whatsapp_id, message)
+    except LLMStreamInterrupted as e:
+        log.error(f"Geração da resposta para {whatsapp_id} interrompida após {len(messages)} mensagens: {e}")
+        complete = False
+    return "\n\n".join(messages), complete
+
+
+async def _run_conversation_stages(
+    session: AsyncSession,
+    whatsapp_id: str,
+    user_query: str,
+    timings: Dict[str, float],
+) -> Optional[str]:
+    """
+    Executa as etapas do turno e retorna o texto da resposta
+    (None quando a resposta já foi enviada em streaming)
+    """
+    # Etapa CRM/LGPD: cliente (find/create) e consentimento em uma única consulta (ou do cache)
+    with _timed(timings, "crm"):
+        client_state = await load_client_state(session, whatsapp_id)
+
     # Fluxo LGPD (Se não houver consentimento)
-    if not consent_given:
+    if not client_state.consent_given:
         if user_query.lower().strip() in ["sim", "s", "yes", "y"]:
             # Registrar consentimento
             new_consent = Consents(
-                client_id=client.id,
+                client_id=client_state.client_id,
                 consent_type=PyConsentType.LGPD_V1,
                 is_given=True
             )
             session.add(new_consent)
             await session.commit()
-            await session.refresh(new_consent)
-            response_text = "Obrigado pelo seu consentimento! Agora posso te ajudar com suas dúvidas ou registrar um ticket de suporte."
-        else:
-            response_text = "Olá! Para continuar, preciso do seu consentimento (LGPD)... (Sim/Não)"
-        # Enviar resposta para EVOAPI
-        await send_response_to_evoapi(whatsapp_id, response_text)
-        return
-    else:
-        # Após verificar consentimento, classificar intenção
-        intent = await get_user_intent(user_query)
-        log.info(f"Intenção detectada para {whatsapp_id}: {intent}")
-        
-        if intent == 'PERGUNTA_RAG':
-            # Fluxo RAG (Se houver consentimento e for pergunta)
-            query_vector = await get_query_embedding(user_query)
-            
-            stmt = select(
-                RagDocuments1536.content
-            ).filter(
-                RagDocuments1536.embedding.cosine_distance(query_vector) < 0.8  # Apenas resultados relevantes
-            ).order_by(
-                RagDocuments1536.embedding.cosine_distance(query_vector)
-            ).limit(3)
-            
-            context_result = await session.execute(stmt)
-            context_chunks = context_result.scalars().all()
-            
-            # Etapa LLM (Gerar Resposta)
-            context_str = "\n\n".join(context_chunks)
-            
-            # Preparar o prompt para o LLM
-            system_prompt = "Você é um assistente útil que responde com base no contexto fornecido."
-            user_prompt = f"""Contexto: {context_str}\n\nPergunta: {user_query}\n\nResponda com base no contexto fornecido. Se não encontrar informações relevantes no contexto, diga que não encontrou informações suficientes para responder."""
-            
-            llm_response_text = await get_resilient_chat_completion(system_prompt, user_prompt)
-            response_text = llm_response_text
-            
-        elif intent == 'PEDIDO_SUPORTE':
-            # Lógica de Criação de Ticket
+            invalidate_client_state(whatsapp_id)
+            return "Obrigado pelo seu consentimento! Agora posso te ajudar com suas dúvidas ou registrar um ticket de suporte."
+        return "Olá! Para continuar, preciso do seu consentimento (LGPD)... (Sim/Não)"
+
+    # Consentimento confirmado: embedding da query em paralelo à classificação de intenção
+    embedding_task = asyncio.create_task(_speculative_query_embedding(user_query, timings))
+    _turn_stats["speculative_embeddings"] += 1
+    try:
+        return await _answer_consented_query(session, whatsapp_id, user_query, client_state, embedding_task, timings)
+    finally:
+        # Sem efeito se o embedding já foi consumido; cancela-o nos demais caminhos
+        await _cancel_speculative(embedding_task)
+
+
+async def _answer_consented_query(
+    session: AsyncSession,
+    whatsapp_id: str,
+    user_query: str,
+    client_state: ClientState,
+    embedding_task: asyncio.Task,
+    timings: Dict[str, float],
+) -> Optional[str]:
+    """
+    Classifica a intenção e responde (RAG ou ticket) a um cliente com consentimento
+    """
+    # Classificar intenção (reaproveitando o embedding em andamento)
+    with _timed(timings, "intent"):
+        decision = await classify_intent(user_query, session, lambda: asyncio.shield(embedding_task))
+    intent = decision.intent
+    log.info(f"Intenção detectada para {whatsapp_id}: {intent} ({decision.source})")
+
+    if intent == 'PERGUNTA_RAG':
+        # O embedding é necessário daqui em diante; se falhou, o retrieval tenta novamente
+        try:
+            query_vector = await embedding_task
+        except Exception as e:
+            log.warning(f"Embedding especulativo falhou: {e}")
+            query_vector = None
+
+        # Cache semântico: reutilizar a resposta de uma pergunta equivalente
+        cached_answer = None
+        if SEMANTIC_ANSWER_CACHE_ENABLED and query_vector is not None:
+            with _timed(timings, "answer_cache"):
+                cached_answer = await lookup_cached_answer(session, query_vector, WHATSAPP_RAG_NAMESPACE)
+
+        if cached_answer is not None:
+            await session.commit()
+            return cached_answer
+
+        # Fluxo RAG (Se houver consentimento e for pergunta)
+        with _timed(timings, "retrieval"):
+            retrieval_result = await retrieve(session, user_query, RetrievalOptions(
+                namespace=WHATSAPP_RAG_NAMESPACE,
+                top_k=RAG_TOP_K,
+                max_distance=RAG_MAX_DISTANCE,  # Apenas resultados relevantes
+            ))
+            # Persistir o embedding da query no cache (se for novo)
+            await session.commit()
+
+        # Etapa Prompt: chunks por relevância dentro do orçamento de tokens
+        with _timed(timings, "prompt"):
+            prompt = build_rag_prompt(user_query, [chunk.content for chunk in retrieval_result.chunks])
+        _record_prompt(prompt)
+        log.info(
+            f"Prompt de {whatsapp_id}: {prompt.prompt_tokens} tokens ({prompt.context_tokens} de contexto, "
+            f"{prompt.chunks_used} chunks, {prompt.chunks_truncated} truncados, "
+            f"{prompt.chunks_deduplicated} duplicados, {prompt.chunks_over_budget} fora do orçamento)"
+        )
+
+        # Etapa LLM (Gerar Resposta)
+        complete = True
+        with _timed(timings, "llm"):
+            if WHATSAPP_STREAMING_ENABLED:
+                llm_response_text, complete = await _stream_answer_to_evoapi(whatsapp_id, prompt, timings)
+                response_text = None
+            else:
+                llm_response_text = await get_resilient_chat_completion(prompt.system_prompt, prompt.user_prompt)
+                response_text = llm_response_text
+
+        # Guardar a resposta apenas quando houve contexto e um provedor respondeu por completo
+        if SEMANTIC_ANSWER_CACHE_ENABLED and retrieval_result.chunks and complete and llm_response_text != LLM_UNAVAILABLE_MESSAGE:
+            await store_answer(
+                session, user_query, retrieval_result.query_vector, WHATSAPP_RAG_NAMESPACE,
+                [chunk.id for chunk in retrieval_result.chunks],
+                [content_hash(chunk.content) for chunk in retrieval_result.chunks],
+                llm_response_text
+            )
+            await session.commit()
+        return response_text
+
+    if intent == 'PEDIDO_SUPORTE':
+        # Pedido de suporte não usa o embedding
+        await _cancel_speculative(embedding_task)
+
+        # Lógica de Criação de Ticket
+        with _timed(timings, "ticket"):
             new_ticket = Tickets(
-                client_id=client.id,
+                client_id=client_state.client_id,
                 description=user_query,
                 status=PyTicketStatus.OPEN
             )
             session.add(new_ticket)
             await session.commit()
             await session.refresh(new_ticket)
-            
-            response_text = f'Obrigado. Seu ticket de suporte (ID: {new_ticket.id}) foi aberto com a descrição: "{user_query}". Em breve, um atendente humano entrará em contato.'
-        else:  # Fallback
-            response_text = 'Desculpe, não consegui entender sua solicitação. Posso ajudar com dúvidas ou abrir um chamado de suporte.'
-    
-    # Etapa Resposta: Enviar resposta para EVOAPI
-    await send_response_to_evoapi(whatsapp_id, response_text)
+
+        return f'Obrigado. Seu ticket de suporte (ID: {new_ticket.id}) foi aberto com a descrição: "{user_query}". Em breve, um atendente humano entrará em contato.'
+
+    # Fallback
+    return 'Desculpe, não consegui entender sua solicitação. Posso ajudar com dúvidas ou abrir um chamado de suporte.'
+
+
+def coalesce_payloads(payloads: List[EvoApiPayload]) -> EvoApiPayload:
+    """
+    Combina mensagens seguidas do mesmo remetente em uma única mensagem (uma por linha)
+    """
+    text = "\n".join(payload.message.body.text for payload in payloads)
+    return EvoApiPayload(
+        sender=payloads[-1].sender,
+        message=EvoApiMessage(body=EvoApiMessageBody(text=text))
+    )
+
+
+# Executor das conversas do webhook (iniciado/encerrado em agent_service/main.py).
+# Cada turno usa a sessão do executor e a do embedding especulativo. Mensagens só são
+# combinadas após o consentimento: sem ele, cada mensagem passa sozinha pelo fluxo
+# LGPD (um "Sim" seguido de uma pergunta não pode virar um único turno)
+conversation_executor = ConversationExecutor(
+    process_conversation, AsyncSessionFactory, coalesce=coalesce_payloads,
+    can_coalesce=has_cached_consent, sessions_per_turn=2
+)
 
 
 @router.post('/evoapi')
-async def handle_evoapi_webhook(
-    payload: EvoApiPayload,
-    background_tasks: BackgroundTasks,
-    session: AsyncSession = Depends(get_db)
-):
+async def handle_evoapi_webhook(payload: EvoApiPayload):
     """
     Endpoint para lidar com o webhook da EVOAPI
     """
-    # Processar a conversação como uma tarefa em segundo plano para não bloquear o webhook
-    background_tasks.add_task(process_conversation, payload, session)
+    # Processar a conversação no executor (sessão própria, ordem por remetente)
+    # para não bloquear o webhook; com a fila cheia, pedir que a EVOAPI reenvie depois
+    try:
+        conversation_executor.submit(payload.sender.id, payload)
+    except ConversationQueueFull as e:
+        log.warning(f"Mensagem de {payload.sender.id} recusada: {e}")
+        raise HTTPException(status_code=503, detail="Serviço sobrecarregado, tente novamente", headers={"Retry-After": "5"})
     
     # Retornar OK imediatamente
-    return {"status": "ok"}
\ No newline at end of file
+    return {"status": "ok"}
+
+
+@router.get('/queue/stats')
+async def get_conversation_queue_stats():
+    """
+    Endpoint para consultar profundidade da fila, mensagens recusadas e tempos de espera
+    """
+    return conversation_executor.stats()
+
+
+@router.get('/intent/stats')
+async def get_intent_classifier_stats():
+    """
+    Endpoint para consultar quantas intenções foram decididas localmente ou pelo LLM
+    """
+    return get_intent_stats()
+
+
+@router.get('/turn/stats')
+async def get_turn_stats():
+    """
+    Endpoint para consultar a latência média por etapa dos turnos de conversa
+    """
+    return {
+        "turns": _turn_stats["turns"],
+        "speculative_embeddings": _turn_stats["speculative_embeddings"],
+        "speculative_embeddings_cancelled": _turn_stats["speculative_embeddings_cancelled"],
+        "client_state_cache": get_client_state_cache_stats(),
+        "prompts": {
+            "count": _turn_stats["prompts"],
+            "avg_tokens": (_turn_stats["prompt_tokens"] / _turn_stats["prompts"]) if _turn_stats["prompts"] else 0.0,
+            "max_tokens": _turn_stats["max_prompt_tokens"],
+            "budget_tokens": RAG_CONTEXT_TOKEN_BUDGET,
+            "chunks_truncated": _turn_stats["chunks_truncated"],
+            "chunks_deduplicated": _turn_stats["chunks_deduplicated"],
+            "chunks_over_budget": _turn_stats["chunks_over_budget"],
+        },
+        "avg_ms": {
+            stage: total / _turn_stats["stage_counts"][stage]
+            for stage, total in _turn_stats["total_ms"].items()
+        },
+    }
+
+
+@router.get('/llm/stats')
+async def get_llm_stats():
+    """
+    Endpoint para consultar o estado do circuit breaker de cada provedor de LLM
+    """
+    return get_llm_provider_stats()
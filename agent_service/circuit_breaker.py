@@ -0,0 +1,117 @@
+import logging
+import time
+from collections import deque
+from typing import Deque, Tuple
+
+from core.config import (
+    LLM_BREAKER_WINDOW_SECONDS,
+    LLM_BREAKER_MIN_REQUESTS,
+    LLM_BREAKER_ERROR_RATE,
+    LLM_BREAKER_OPEN_SECONDS,
+    LLM_BREAKER_HALF_OPEN_PROBES,
+)
+
+# Configuração do logger
+log = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker por provedor, com taxa de erro em janela deslizante (por tempo).
+    - closed: chamadas liberadas; abre se a taxa de erro da janela ultrapassar o limite
+    - open: chamadas recusadas até passar `open_seconds`
+    - half_open: libera até `half_open_probes` chamadas de teste; sucesso fecha, falha reabre
+    Usado em um único event loop (sem locks).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        window_seconds: float = LLM_BREAKER_WINDOW_SECONDS,
+        min_requests: int = LLM_BREAKER_MIN_REQUESTS,
+        error_rate: float = LLM_BREAKER_ERROR_RATE,
+        open_seconds: float = LLM_BREAKER_OPEN_SECONDS,
+        half_open_probes: int = LLM_BREAKER_HALF_OPEN_PROBES,
+    ):
+        self.name = name
+        self.window_seconds = window_seconds
+        self.min_requests = min_requests
+        self.error_rate = error_rate
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+        self.state = CLOSED
+        self._outcomes: Deque[Tuple[float, bool]] = deque()
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+        self.times_opened = 0
+        self.rejected = 0
+
+    def _trim(self, now: float) -> None:
+        while self._outcomes and self._outcomes[0][0] < now - self.window_seconds:
+            self._outcomes.popleft()
+
+    def allow_request(self) -> bool:
+        """Indica se a chamada pode ser feita agora (e reserva a vaga de teste no half-open)."""
+        now = time.monotonic()
+        if self.state == OPEN:
+            if now - self._opened_at < self.open_seconds:
+                self.rejected += 1
+                return False
+            self.state = HALF_OPEN
+            self._probes_in_flight = 0
+            log.info(f"Circuit breaker '{self.name}': half-open, testando o provedor")
+        if self.state == HALF_OPEN:
+            if self._probes_in_flight >= self.half_open_probes:
+                self.rejected += 1
+                return False
+            self._probes_in_flight += 1
+        return True
+
+    def record_success(self) -> None:
+        now = time.monotonic()
+        if self.state == HALF_OPEN:
+            self.state = CLOSED
+            self._outcomes.clear()
+            log.info(f"Circuit breaker '{self.name}': fechado, provedor recuperado")
+        self._outcomes.append((now, True))
+        self._trim(now)
+
+    def record_failure(self) -> None:
+        now = time.monotonic()
+        if self.state == HALF_OPEN:
+            self._open(now)
+            return
+        self._outcomes.append((now, False))
+        self._trim(now)
+        failures = sum(1 for _, success in self._outcomes if not success)
+        if len(self._outcomes) >= self.min_requests and failures / len(self._outcomes) >= self.error_rate:
+            self._open(now)
+
+    def release(self) -> None:
+        """Devolve a vaga de teste de uma chamada interrompida sem resultado (ex.: cancelada)."""
+        if self.state == HALF_OPEN and self._probes_in_flight > 0:
+            self._probes_in_flight -= 1
+
+    def _open(self, now: float) -> None:
+        self.state = OPEN
+        self._opened_at = now
+        self._probes_in_flight = 0
+        self._outcomes.clear()
+        self.times_opened += 1
+        log.warning(f"Circuit breaker '{self.name}': aberto por {self.open_seconds}s")
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        self._trim(now)
+        failures = sum(1 for _, success in self._outcomes if not success)
+        return {
+            "state": self.state,
+            "window_requests": len(self._outcomes),
+            "window_error_rate": (failures / len(self._outcomes)) if self._outcomes else 0.0,
+            "times_opened": self.times_opened,
+            "rejected": self.rejected,
+        }
@@ -0,0 +1,105 @@
+import logging
+from dataclasses import dataclass
+from typing import Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.cache import LRUTTLCache
+from core.config import CLIENT_STATE_CACHE_SIZE, CLIENT_STATE_CACHE_TTL_SECONDS
+
+# Configuração do logger
+log = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class ClientState:
+    client_id: int
+    # Último consentimento LGPD_V1 registrado para o cliente (False se não houver)
+    consent_given: bool
+
+
+# whatsapp_id -> ClientState (apenas clientes com consentimento; ver load_client_state)
+client_state_cache = LRUTTLCache(
+    maxsize=CLIENT_STATE_CACHE_SIZE,
+    ttl_seconds=CLIENT_STATE_CACHE_TTL_SECONDS,
+)
+
+# Uma única ida ao banco: cria o cliente se não existir e retorna seu id junto
+# com o consentimento LGPD mais recente. ON CONFLICT DO NOTHING evita reescrever
+# a linha do cliente a cada mensagem; o UNION ALL busca o cliente já existente.
+_UPSERT_CLIENT_STATE = text("""
+    WITH inserted AS (
+        INSERT INTO crm.clients (whatsapp_id, created_at, updated_at)
+        VALUES (:whatsapp_id, timezone('utc', now()), timezone('utc', now()))
+        ON CONFLICT (whatsapp_id) DO NOTHING
+        RETURNING id
+    ),
+    client AS (
+        SELECT id, true AS created FROM inserted
+        UNION ALL
+        SELECT id, false AS created FROM crm.clients WHERE whatsapp_id = :whatsapp_id
+        LIMIT 1
+    )
+    SELECT client.id, client.created, COALESCE(consent.is_given, false) AS consent_given
+    FROM client
+    LEFT JOIN LATERAL (
+        SELECT c.is_given
+        FROM crm.consents c
+        WHERE c.client_id = client.id
+          AND c.consent_type = 'LGPD_V1'::crm.consenttype
+        ORDER BY c.timestamp DESC, c.id DESC
+        LIMIT 1
+    ) consent ON true
+""")
+
+
+async def load_client_state(session: AsyncSession, whatsapp_id: str) -> ClientState:
+    """
+    Retorna (client_id, consentimento) do remetente: do cache em memória quando
+    possível, senão com uma única instrução de upsert + consulta do consentimento.
+    Apenas estados com consentimento são guardados em cache: um cliente sem
+    consentimento tende a respondê-lo logo em seguida (possivelmente em outro processo).
+    """
+    state = client_state_cache.get(whatsapp_id)
+    if state is not None:
+        return state
+
+    row = None
+    # Se outra transação inserir o mesmo cliente em paralelo, o INSERT não retorna
+    # linha e o SELECT ainda não a enxerga: basta repetir a instrução.
+    for _ in range(2):
+        row = (await session.execute(_UPSERT_CLIENT_STATE, {"whatsapp_id": whatsapp_id})).first()
+        if row is not None:
+            break
+    if row is None:
+        raise RuntimeError(f"Não foi possível criar/obter o cliente {whatsapp_id}")
+
+    if row.created:
+        await session.commit()
+        log.info(f"Novo cliente {row.id} criado para {whatsapp_id}")
+
+    state = ClientState(client_id=row.id, consent_given=row.consent_given)
+    if state.consent_given:
+        client_state_cache.set(whatsapp_id, state)
+    return state
+
+
+def has_cached_consent(whatsapp_id: str) -> bool:
+    """
+    Indica se o consentimento do remetente já está confirmado no cache (sem ir ao banco)
+    """
+    state = client_state_cache.peek(whatsapp_id)
+    return state is not None and state.consent_given
+
+
+def invalidate_client_state(whatsapp_id: Optional[str]) -> None:
+    """
+    Remove o estado em cache do cliente (chamado após registrar um consentimento)
+    """
+    if whatsapp_id:
+        client_state_cache.invalidate(whatsapp_id)
+
+
+def get_client_state_cache_stats() -> dict:
+    return client_state_cache.stats()
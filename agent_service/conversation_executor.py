@@ -0,0 +1,256 @@
+import asyncio
+import logging
+import time
+import zlib
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from core.config import (
+    DB_POOL_MODE,
+    DB_POOL_SIZE,
+    DB_MAX_OVERFLOW,
+    CONVERSATION_WORKERS,
+    CONVERSATION_QUEUE_MAXSIZE,
+    CONVERSATION_SHUTDOWN_TIMEOUT_SECONDS,
+    CONVERSATION_DEBOUNCE_SECONDS,
+    CONVERSATION_DEBOUNCE_MAX_SECONDS,
+    CONVERSATION_COALESCE_MAX_MESSAGES,
+)
+
+# Configuração do logger
+log = logging.getLogger(__name__)
+
+
+class ConversationQueueFull(Exception):
+    """A fila do consumidor responsável pelo remetente está cheia (load shedding)."""
+
+
+class _Mailbox:
+    """
+    Caixa de mensagens de um remetente: acumula as mensagens que chegam
+    enquanto o turno ainda não começou a ser processado
+    """
+    __slots__ = ("key", "shard", "items", "first_at", "enqueued_at", "timer", "queued")
+
+    def __init__(self, key: str, shard: int, item: Any):
+        self.key = key
+        self.shard = shard
+        self.items = [item]
+        self.first_at = time.perf_counter()
+        self.enqueued_at: Optional[float] = None
+        self.timer: Optional[asyncio.TimerHandle] = None
+        self.queued = False
+
+
+class ConversationExecutor:
+    """
+    Executor de conversas em processo: N consumidores, cada um com sua fila
+    limitada. As mensagens de um mesmo whatsapp_id vão sempre para a mesma fila,
+    o que serializa os turnos por remetente; cada turno é processado com uma
+    sessão própria, obtida do pool. Se o handler abrir sessões adicionais
+    (`sessions_per_turn`), o executor usa até N * sessions_per_turn conexões,
+    que devem caber em DB_POOL_SIZE + DB_MAX_OVERFLOW.
+
+    Cada remetente tem uma caixa de mensagens: mensagens que chegam dentro da
+    janela de debounce (ou enquanto o turno aguarda na fila) são combinadas
+    por `coalesce` em um único turno. Se `can_coalesce(key)` for falso, cada
+    mensagem do remetente é um turno próprio, sem debounce. Quando a fila está
+    cheia, a mensagem que abriria um novo turno é recusada em vez de acumular trabalho.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[Any, AsyncSession], Awaitable[None]],
+        session_factory: async_sessionmaker,
+        coalesce: Optional[Callable[[List[Any]], Any]] = None,
+        can_coalesce: Optional[Callable[[str], bool]] = None,
+        workers: int = CONVERSATION_WORKERS,
+        queue_maxsize: int = CONVERSATION_QUEUE_MAXSIZE,
+        debounce_seconds: float = CONVERSATION_DEBOUNCE_SECONDS,
+        debounce_max_seconds: float = CONVERSATION_DEBOUNCE_MAX_SECONDS,
+        coalesce_max_messages: int = CONVERSATION_COALESCE_MAX_MESSAGES,
+        sessions_per_turn: int = 1,
+    ):
+        self.handler = handler
+        self.session_factory = session_factory
+        self.coalesce = coalesce
+        self.can_coalesce = can_coalesce
+        self.workers = workers
+        self.sessions_per_turn = sessions_per_turn
+        self.queue_maxsize = queue_maxsize
+        self.debounce_seconds = debounce_seconds
+        self.debounce_max_seconds = debounce_max_seconds
+        # Sem função de combinação, cada mensagem é um turno
+        self.coalesce_max_messages = coalesce_max_messages if coalesce is not None else 1
+        self._queues: List[asyncio.Queue] = []
+        self._consumers: List[asyncio.Task] = []
+        # Caixa aberta (ainda não em processamento) de cada remetente
+        self._mailboxes: Dict[str, _Mailbox] = {}
+        # Caixas em debounce por fila (ocupam uma vaga reservada na fila)
+        self._collecting: List[int] = []
+        self._stats = {
+            "messages": 0,
+            "coalesced": 0,
+            "turns": 0,
+            "rejected": 0,
+            "processed": 0,
+            "failed": 0,
+            "max_depth": 0,
+            "total_wait_ms": 0.0,
+            "total_processing_ms": 0.0,
+        }
+
+    @property
+    def running(self) -> bool:
+        return bool(self._consumers)
+
+    async def start(self) -> None:
+        """Cria as filas e inicia os consumidores (no startup da API)."""
+        if self.running:
+            return
+        self._queues = [asyncio.Queue(maxsize=self.queue_maxsize) for _ in range(self.workers)]
+        self._collecting = [0] * self.workers
+        self._consumers = [
+            asyncio.create_task(self._consume(index, queue), name=f"conversation-consumer-{index}")
+            for index, queue in enumerate(self._queues)
+        ]
+        log.info(
+            f"Executor de conversas iniciado: {self.workers} consumidores, fila de {self.queue_maxsize} "
+            f"por consumidor, debounce de {self.debounce_seconds}s"
+        )
+        # Turnos além do pool ficariam bloqueados em pool_timeout aguardando conexão
+        max_connections = self.workers * self.sessions_per_turn
+        if DB_POOL_MODE == "queue" and max_connections > DB_POOL_SIZE + DB_MAX_OVERFLOW:
+            log.warning(
+                f"Executor de conversas pode usar {max_connections} conexões, mas o pool permite "
+                f"{DB_POOL_SIZE + DB_MAX_OVERFLOW} (DB_POOL_SIZE + DB_MAX_OVERFLOW); "
+                f"reduza CONVERSATION_WORKERS ou aumente o pool"
+            )
+
+    async def stop(self, timeout: float = CONVERSATION_SHUTDOWN_TIMEOUT_SECONDS) -> None:
+        """Libera as caixas em debounce, aguarda o esvaziamento das filas (até `timeout`) e encerra os consumidores."""
+        if not self.running:
+            return
+        for mailbox in list(self._mailboxes.values()):
+            if not mailbox.queued:
+                self._enqueue(mailbox)
+        try:
+            await asyncio.wait_for(asyncio.gather(*(queue.join() for queue in self._queues)), timeout)
+        except asyncio.TimeoutError:
+            log.warning(f"Executor de conversas encerrado com {self.depth()} turnos pendentes")
+        for consumer in self._consumers:
+            consumer.cancel()
+        await asyncio.gather(*self._consumers, return_exceptions=True)
+        self._consumers = []
+        self._queues = []
+        self._mailboxes.clear()
+
+    def _shard_for(self, key: str) -> int:
+        return zlib.crc32(key.encode('utf-8')) % len(self._queues)
+
+    def submit(self, key: str, item: Any) -> None:
+        """
+        Entrega `item` à caixa de mensagens de `key` (whatsapp_id): junta-se ao
+        turno ainda não iniciado do remetente ou abre um novo turno.
+        Levanta ConversationQueueFull se a fila do remetente estiver cheia.
+        """
+        if not self.running:
+            raise RuntimeError("Executor de conversas não iniciado")
+
+        self._stats["messages"] += 1
+        coalescing = self.coalesce_max_messages > 1 and (self.can_coalesce is None or self.can_coalesce(key))
+        mailbox = self._mailboxes.get(key)
+        if coalescing and mailbox is not None and len(mailbox.items) < self.coalesce_max_messages:
+            mailbox.items.append(item)
+            self._stats["coalesced"] += 1
+            if not mailbox.queued:
+                self._schedule_flush(mailbox)
+            return
+        if mailbox is not None and not mailbox.queued:
+            # Caixa cheia (ou remetente que não pode ter mensagens combinadas):
+            # liberar o turno atual e abrir outro em seguida
+            self._enqueue(mailbox)
+
+        shard = self._shard_for(key)
+        if self._queues[shard].qsize() + self._collecting[shard] >= self.queue_maxsize:
+            self._stats["messages"] -= 1
+            self._stats["rejected"] += 1
+            raise ConversationQueueFull(f"Fila de conversas cheia ({self.queue_maxsize} turnos)")
+
+        mailbox = _Mailbox(key, shard, item)
+        self._mailboxes[key] = mailbox
+        self._stats["turns"] += 1
+        if coalescing and self.debounce_seconds > 0:
+            self._collecting[shard] += 1
+            self._schedule_flush(mailbox)
+        else:
+            self._enqueue(mailbox)
+
+    def _schedule_flush(self, mailbox: _Mailbox) -> None:
+        """(Re)inicia a janela de debounce, limitada a debounce_max_seconds desde a primeira mensagem."""
+        if mailbox.timer is not None:
+            mailbox.timer.cancel()
+        remaining = mailbox.first_at + self.debounce_max_seconds - time.perf_counter()
+        delay = max(0.0, min(self.debounce_seconds, remaining))
+        mailbox.timer = asyncio.get_running_loop().call_later(delay, self._enqueue, mailbox)
+
+    def _enqueue(self, mailbox: _Mailbox) -> None:
+        if mailbox.queued:
+            return
+        if mailbox.timer is not None:
+            mailbox.timer.cancel()
+            mailbox.timer = None
+            self._collecting[mailbox.shard] -= 1
+        mailbox.queued = True
+        mailbox.enqueued_at = time.perf_counter()
+        queue = self._queues[mailbox.shard]
+        # A vaga foi reservada em submit(); a fila não excede queue_maxsize
+        queue.put_nowait(mailbox)
+        self._stats["max_depth"] = max(self._stats["max_depth"], queue.qsize())
+
+    async def _consume(self, index: int, queue: asyncio.Queue) -> None:
+        while True:
+            mailbox = await queue.get()
+            # A partir daqui novas mensagens do remetente abrem o próximo turno
+            if self._mailboxes.get(mailbox.key) is mailbox:
+                del self._mailboxes[mailbox.key]
+            started = time.perf_counter()
+            self._stats["total_wait_ms"] += (started - mailbox.enqueued_at) * 1000
+            try:
+                item = mailbox.items[0] if len(mailbox.items) == 1 else self.coalesce(mailbox.items)
+                async with self.session_factory() as session:
+                    await self.handler(item, session)
+                self._stats["processed"] += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._stats["failed"] += 1
+                log.error(f"Erro ao processar conversa (consumidor {index}): {e}", exc_info=True)
+            finally:
+                self._stats["total_processing_ms"] += (time.perf_counter() - started) * 1000
+                queue.task_done()
+
+    def depth(self) -> int:
+        return sum(queue.qsize() for queue in self._queues)
+
+    def stats(self) -> dict:
+        finished = self._stats["processed"] + self._stats["failed"]
+        return {
+            "running": self.running,
+            "workers": self.workers,
+            "queue_maxsize": self.queue_maxsize,
+            "debounce_seconds": self.debounce_seconds,
+            "depth": self.depth(),
+            "depth_by_worker": [queue.qsize() for queue in self._queues],
+            "collecting": sum(self._collecting),
+            "max_depth": self._stats["max_depth"],
+            "messages": self._stats["messages"],
+            "coalesced": self._stats["coalesced"],
+            "turns": self._stats["turns"],
+            "rejected": self._stats["rejected"],
+            "processed": self._stats["processed"],
+            "failed": self._stats["failed"],
+            "avg_wait_ms": (self._stats["total_wait_ms"] / finished) if finished else 0.0,
+            "avg_processing_ms": (self._stats["total_processing_ms"] / finished) if finished else 0.0,
+        }
@@ -0,0 +1,270 @@
+import asyncio
+import logging
+import re
+import time
+import unicodedata
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import numpy as np
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.config import INTENT_FAST_PATH_ENABLED, INTENT_CENTROID_MIN_MARGIN
+from core.database import AsyncSessionFactory
+from retrieval.query_embedding import get_query_embedding, get_query_embeddings
+from agent_service.llm_client import get_resilient_chat_completion
+
+# Configuração do logger
+log = logging.getLogger(__name__)
+
+INTENT_RAG = 'PERGUNTA_RAG'
+INTENT_SUPPORT = 'PEDIDO_SUPORTE'
+
+# Regras por palavra-chave (sobre o texto sem acentos e em minúsculas)
+SUPPORT_PATTERNS = [
+    r"\bsuporte\b",
+    r"\bchamado\b",
+    r"\bticket\b",
+    r"\batendente\b",
+    r"\bhumano\b",
+    r"\breclama(r|cao)\b",
+    r"\bnao (consigo|funciona|esta funcionando|abre|carrega)\b",
+    r"\b(deu|da|esta com|apareceu( um)?) erro\b",
+    r"\b(tenho|estou com|tive) (um )?problema\b",
+    r"\b(travou|travando|quebrou|parou de funcionar)\b",
+]
+QUESTION_PATTERNS = [
+    r"\?\s*$",
+    r"^(o que|qual|quais|quando|onde|quanto|quantos|quantas|como|por que|quem)\b",
+    r"\b(gostaria de saber|queria saber|pode me explicar|me explique)\b",
+]
+
+# Exemplos usados para calcular o centróide de cada intenção
+SEED_EXAMPLES = {
+    INTENT_RAG: [
+        "Qual é o horário de funcionamento?",
+        "Como faço para emitir a segunda via do boleto?",
+        "Quais documentos são necessários para o cadastro?",
+        "O que está incluído no plano básico?",
+        "Onde fica o escritório de vocês?",
+        "Quanto custa o serviço mensal?",
+        "Qual o prazo para entrega do relatório?",
+        "Vocês atendem empresas do Simples Nacional?",
+    ],
+    INTENT_SUPPORT: [
+        "Preciso abrir um chamado de suporte",
+        "O sistema não está funcionando",
+        "Estou com problema para acessar minha conta",
+        "Quero falar com um atendente",
+        "Deu erro ao enviar o arquivo",
+        "Minha nota fiscal não foi emitida, preciso de ajuda",
+        "O aplicativo travou e não abre mais",
+        "Quero registrar uma reclamação",
+    ],
+}
+
+_support_regexes = [re.compile(pattern) for pattern in SUPPORT_PATTERNS]
+_question_regexes = [re.compile(pattern) for pattern in QUESTION_PATTERNS]
+
+
+@dataclass
+class IntentDecision:
+    intent: str
+    # Confiança da etapa que decidiu (1.0 para regras; margem de cosseno para centróides)
+    confidence: Optional[float]
+    # "rules", "centroid" ou "llm"
+    source: str
+    query_vector: Optional[List[float]] = None
+
+
+class _CentroidModel:
+    """
+    Classificador por centróide mais próximo sobre o embedding da query.
+    Os centróides são calculados apenas a partir dos exemplos fixos de
+    SEED_EXAMPLES (mensagens de usuários não alteram as fronteiras).
+    """
+
+    def __init__(self):
+        self.sums: Dict[str, np.ndarray] = {}
+        self.counts: Dict[str, int] = {}
+        self.ready = False
+        self._lock = asyncio.Lock()
+
+    async def ensure_ready(self, session: AsyncSession) -> None:
+        if self.ready:
+            return
+        async with self._lock:
+            if self.ready:
+                return
+            # Todos os exemplos em uma única chamada de embeddings
+            examples = [(intent, example) for intent, intent_examples in SEED_EXAMPLES.items() for example in intent_examples]
+            vectors = await get_query_embeddings([example for _, example in examples], session)
+            for (intent, _), vector in zip(examples, vectors):
+                self.add(intent, vector)
+            self.ready = True
+            log.info("Centróides de intenção calculados a partir dos exemplos")
+
+    def add(self, intent: str, vector: List[float]) -> None:
+        vector = _normalize(np.asarray(vector, dtype=np.float32))
+        if intent in self.sums:
+            self.sums[intent] += vector
+            self.counts[intent] += 1
+        else:
+            self.sums[intent] = vector.copy()
+            self.counts[intent] = 1
+
+    def predict(self, vector: List[float]) -> tuple:
+        """Retorna (intenção, margem entre as duas maiores similaridades)."""
+        query = _normalize(np.asarray(vector, dtype=np.float32))
+        similarities = sorted(
+            ((float(_normalize(total) @ query), intent) for intent, total in self.sums.items()),
+            reverse=True
+        )
+        best_similarity, best_intent = similarities[0]
+        margin = best_similarity - similarities[1][0] if len(similarities) > 1 else best_similarity
+        return best_intent, margin
+
+
+def _normalize(vector: np.ndarray) -> np.ndarray:
+    return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+
+def _fold(text: str) -> str:
+    """Minúsculas, sem acentos e com espaços normalizados."""
+    text = unicodedata.normalize('NFKD', text.casefold())
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def classify_by_rules(query: str) -> Optional[str]:
+    """
+    Decide pela presença de palavras-chave quando apenas uma das intenções
+    é indicada; em caso de ambiguidade (ou nenhuma indicação) retorna None
+    """
+    folded = _fold(query)
+    support = any(regex.search(folded) for regex in _support_regexes)
+    question = any(regex.search(folded) for regex in _question_regexes)
+    if support and not question:
+        return INTENT_SUPPORT
+    if question and not support:
+        return INTENT_RAG
+    return None
+
+
+async def classify_with_llm(query: str) -> str:
+    """
+    Classifica a intenção com o LLM (caminho lento, usado nos casos de baixa confiança)
+    """
+    system_prompt = "Você é um classificador. A mensagem do usuário é uma PERGUNTA_RAG ou um PEDIDO_SUPORTE? Responda *apenas* com o nome da classe."
+
+    intent = await get_resilient_chat_completion(system_prompt, query)
+    return intent.strip()
+
+
+_centroids = _CentroidModel()
+
+
+async def warm_up_intent_classifier() -> None:
+    """
+    Calcula os centróides no startup da API, fora do caminho das requisições.
+    Em caso de falha, o cálculo é refeito sob demanda na primeira classificação.
+    """
+    if not INTENT_FAST_PATH_ENABLED:
+        return
+    try:
+        async with AsyncSessionFactory() as session:
+            await _centroids.ensure_ready(session)
+            await session.commit()
+    except Exception as e:
+        log.warning(f"Falha ao pré-calcular os centróides de intenção: {e}")
+
+# Métricas agregadas do processo (para monitoramento)
+_stats = {
+    "decisions": 0,
+    "by_source": {"rules": 0, "centroid": 0, "llm": 0},
+    "by_intent": {},
+    "centroid_margins": [],
+    "total_ms": {"rules": 0.0, "centroid": 0.0, "llm": 0.0},
+}
+# Quantidade de margens recentes mantidas para as estatísticas de confiança
+_MARGIN_WINDOW = 1000
+
+
+async def classify_intent(
+    query: str,
+    session: AsyncSession,
+    query_vector_provider: Optional[Callable[[], Awaitable[List[float]]]] = None,
+) -> IntentDecision:
+    """
+    Classificação em camadas: regras por palavra-chave, centróide mais próximo
+    sobre o embedding da query (o mesmo usado no retrieval) e, apenas quando a
+    margem for menor que INTENT_CENTROID_MIN_MARGIN, o LLM.
+    `query_vector_provider` permite reaproveitar um embedding já em andamento.
+    """
+    started = time.perf_counter()
+    if not INTENT_FAST_PATH_ENABLED:
+        decision = IntentDecision(await classify_with_llm(query), None, 'llm')
+        _record(decision, started)
+        return decision
+
+    intent = classify_by_rules(query)
+    if intent is not None:
+        decision = IntentDecision(intent, 1.0, 'rules')
+        _record(decision, started)
+        return decision
+
+    query_vector = None
+    margin = None
+    try:
+        if query_vector_provider is not None:
+            query_vector = await query_vector_provider()
+        else:
+            query_vector = await get_query_embedding(query, session)
+        await _centroids.ensure_ready(session)
+        intent, margin = _centroids.predict(query_vector)
+        _stats["centroid_margins"].append(margin)
+        del _stats["centroid_margins"][:-_MARGIN_WINDOW]
+        if margin >= INTENT_CENTROID_MIN_MARGIN:
+            decision = IntentDecision(intent, margin, 'centroid', query_vector)
+            _record(decision, started)
+            return decision
+    except Exception as e:
+        log.warning(f"Classificação local por centróides indisponível: {e}")
+
+    intent = await classify_with_llm(query)
+    decision = IntentDecision(intent, margin, 'llm', query_vector)
+    _record(decision, started)
+    return decision
+
+
+def _record(decision: IntentDecision, started: float) -> None:
+    elapsed = (time.perf_counter() - started) * 1000
+    _stats["decisions"] += 1
+    _stats["by_source"][decision.source] += 1
+    _stats["by_intent"][decision.intent] = _stats["by_intent"].get(decision.intent, 0) + 1
+    _stats["total_ms"][decision.source] += elapsed
+    log.info(f"Intenção {decision.intent} decidida por {decision.source} (confiança={decision.confidence}) em {elapsed:.1f}ms")
+
+
+def get_intent_stats() -> dict:
+    """
+    Estatísticas do classificador: decisões por etapa, taxa de fallback para o
+    LLM, latência média por etapa e distribuição das margens dos centróides
+    """
+    decisions = _stats["decisions"]
+    margins = _stats["centroid_margins"]
+    return {
+        "decisions": decisions,
+        "by_source": dict(_stats["by_source"]),
+        "by_intent": dict(_stats["by_intent"]),
+        "llm_fallback_rate": (_stats["by_source"]["llm"] / decisions) if decisions else 0.0,
+        "avg_ms": {
+            source: (total / _stats["by_source"][source] if _stats["by_source"][source] else 0.0)
+            for source, total in _stats["total_ms"].items()
+        },
+        "centroid_min_margin": INTENT_CENTROID_MIN_MARGIN,
+        "centroid_margin_percentiles": (
+            {f"p{p}": float(np.percentile(margins, p)) for p in (10, 50, 90)} if margins else {}
+        ),
+        "centroid_examples": dict(_centroids.counts),
+    }
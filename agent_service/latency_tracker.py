@@ -0,0 +1,44 @@
+import bisect
+from collections import deque
+from typing import Deque, List, Optional
+
+from core.config import LLM_LATENCY_WINDOW
+
+
+class LatencyTracker:
+    """
+    Latências recentes (em segundos) de um provedor, em janela deslizante de
+    tamanho fixo, com percentis calculados sobre a janela
+    """
+
+    def __init__(self, window: int = LLM_LATENCY_WINDOW):
+        self._samples: Deque[float] = deque(maxlen=window)
+        # Cópia ordenada da janela, mantida incrementalmente para os percentis
+        self._sorted: List[float] = []
+        self.count = 0
+
+    def record(self, seconds: float) -> None:
+        if len(self._samples) == self._samples.maxlen:
+            oldest = self._samples[0]
+            del self._sorted[bisect.bisect_left(self._sorted, oldest)]
+        self._samples.append(seconds)
+        bisect.insort(self._sorted, seconds)
+        self.count += 1
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, p: float) -> Optional[float]:
+        """Percentil `p` (0-100) da janela, ou None se ainda não houver amostras."""
+        if not self._sorted:
+            return None
+        index = min(len(self._sorted) - 1, max(0, int(round(p / 100 * (len(self._sorted) - 1)))))
+        return self._sorted[index]
+
+    def stats(self) -> dict:
+        return {
+            "samples": len(self._samples),
+            "total": self.count,
+            **{f"p{p}_ms": (value * 1000 if value is not None else None)
+               for p, value in ((p, self.percentile(p)) for p in (50, 90, 95, 99))},
+        }
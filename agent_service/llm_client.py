@@ -1,71 +1,365 @@
 import asyncio
 import logging
+import time
+from typing import AsyncIterator
 from openai import AsyncOpenAI
 import httpx
 import os
 import json
 
+from core.config import (
+    OPENAI_CHAT_TIMEOUT_SECONDS,
+    OPENAI_CHAT_MAX_RETRIES,
+    HTTP_CONNECT_TIMEOUT_SECONDS,
+    LLM_HEDGING_ENABLED,
+    LLM_HEDGE_PERCENTILE,
+    LLM_HEDGE_MIN_DELAY_SECONDS,
+    LLM_HEDGE_MAX_DELAY_SECONDS,
+    LLM_HEDGE_DEFAULT_DELAY_SECONDS,
+    LLM_HEDGE_MIN_SAMPLES,
+)
+from core.http_clients import get_http_client
+from agent_service.circuit_breaker import CircuitBreaker
+from agent_service.latency_tracker import LatencyTracker
+
 # Configuração do logger
 log = logging.getLogger(__name__)
 
-# Instanciar o cliente primário (OpenAI)
-primary_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Instanciar o cliente primário (OpenAI) com timeouts explícitos de conexão e leitura.
+# Sem retentativas internas: em falha, o fallback é imediato e o circuit breaker decide.
+primary_client = AsyncOpenAI(
+    api_key=os.getenv("OPENAI_API_KEY"),
+    timeout=httpx.Timeout(OPENAI_CHAT_TIMEOUT_SECONDS, connect=HTTP_CONNECT_TIMEOUT_SECONDS),
+    max_retries=OPENAI_CHAT_MAX_RETRIES,
+)
 
+# Resposta devolvida quando nenhum provedor está disponível (não deve ir para o cache)
+LLM_UNAVAILABLE_MESSAGE = 'Desculpe, nossos sistemas de IA estão temporariamente indisponíveis. Por favor, tente novamente em alguns instantes.'
 
-async def get_resilient_chat_completion(system_prompt: str, user_prompt: str) -> str:
+# Um circuit breaker por provedor, na ordem de preferência
+breakers = {
+    "openai": CircuitBreaker("openai"),
+    "ollama": CircuitBreaker("ollama"),
+}
+
+# Latências recentes de cada provedor (definem o atraso do hedge)
+latencies = {
+    "openai": LatencyTracker(),
+    "ollama": LatencyTracker(),
+}
+
+_hedge_stats = {"hedged": 0, "secondary_wins": 0, "primary_wins": 0}
+
+
+async def _openai_chat_completion(system_prompt: str, user_prompt: str) -> str:
+    """
+    Chamada ao provedor primário (OpenAI)
+    """
+    response = await primary_client.chat.completions.create(
+        model='gpt-4o-mini',
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ],
+        max_tokens=500,
+        temperature=0.7
+    )
+    return response.choices[0].message.content
+
+
+async def _ollama_chat_completion(system_prompt: str, user_prompt: str) -> str:
+    """
+    Chamada ao provedor secundário (Ollama) diretamente via httpx
+    """
+    ollama_base_url = os.getenv("OLLAMA_API_BASE_URL")
+    ollama_model_name = os.getenv("OLLAMA_CHAT_MODEL_NAME")
+    
+    if not ollama_base_url or not ollama_model_name:
+        raise Exception("Variáveis de ambiente do Ollama não configuradas corretamente")
+    
+    payload = {
+        "model": ollama_model_name,
+        "messages": [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ],
+        "stream": False,
+        "options": {
+            "temperature": 0.7,
+            "max_tokens": 500
+        }
+    }
+    
+    client = get_http_client("ollama")
+    response = await client.post(
+        f"{ollama_base_url.rstrip('/')}/chat/completions",
+        json=payload,
+        headers={"Content-Type": "application/json"}
+    )
+    
+    if response.status_code == 200:
+        result = response.json()
+        return result['choices'][0]['message']['content']
+    else:
+        raise Exception(f"Erro na API do Ollama: {response.status_code} - {response.text}")
+
+
+async def _openai_chat_completion_stream(system_prompt: str, user_prompt: str) -> AsyncIterator[str]:
+    """
+    Chamada ao provedor primário (OpenAI) em streaming: produz os trechos de texto gerados
+    """
+    stream = await primary_client.chat.completions.create(
+        model='gpt-4o-mini',
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ],
+        max_tokens=500,
+        temperature=0.7,
+        stream=True
+    )
+    async for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+
+async def _ollama_chat_completion_stream(system_prompt: str, user_prompt: str) -> AsyncIterator[str]:
+    """
+    Chamada ao provedor secundário (Ollama) com "stream": true; a API compatível
+    com a OpenAI responde em Server-Sent Events ("data: {...}" ... "data: [DONE]")
+    """
+    ollama_base_url = os.getenv("OLLAMA_API_BASE_URL")
+    ollama_model_name = os.getenv("OLLAMA_CHAT_MODEL_NAME")
+
+    if not ollama_base_url or not ollama_model_name:
+        raise Exception("Variáveis de ambiente do Ollama não configuradas corretamente")
+
+    payload = {
+        "model": ollama_model_name,
+        "messages": [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ],
+        "stream": True,
+        "options": {
+            "temperature": 0.7,
+            "max_tokens": 500
+        }
+    }
+
+    client = get_http_client("ollama")
+    async with client.stream(
+        "POST",
+        f"{ollama_base_url.rstrip('/')}/chat/completions",
+        json=payload,
+        headers={"Content-Type": "application/json"}
+    ) as response:
+        if response.status_code != 200:
+            body = await response.aread()
+            raise Exception(f"Erro na API do Ollama: {response.status_code} - {body.decode('utf-8', errors='replace')}")
+        async for line in response.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            data = line[len("data:"):].strip()
+            if data == "[DONE]":
+                break
+            choices = json.loads(data).get('choices') or []
+            content = choices[0].get('delta', {}).get('content') if choices else None
+            if content:
+                yield content
+
+
+PROVIDERS = {
+    "openai": _openai_chat_completion,
+    "ollama": _ollama_chat_completion,
+}
+
+STREAMING_PROVIDERS = {
+    "openai": _openai_chat_completion_stream,
+    "ollama": _ollama_chat_completion_stream,
+}
+
+
+class LLMStreamInterrupted(Exception):
+    """O provedor falhou depois de já ter produzido parte da resposta."""
+
+
+def hedge_delay(name: str) -> float:
     """
-    Função que tenta primeiro o cliente primário (OpenAI) e, em caso de falha,
-    faz fallback para o cliente secundário (Ollama).
+    Tempo de espera pelo provedor `name` antes de disparar a requisição de hedge:
+    o percentil LLM_HEDGE_PERCENTILE de sua latência recente, dentro dos limites
+    configurados (valor padrão enquanto houver poucas amostras)
     """
-    # Tentar primeiro com o cliente primário (OpenAI)
+    tracker = latencies[name]
+    if len(tracker) < LLM_HEDGE_MIN_SAMPLES:
+        return LLM_HEDGE_DEFAULT_DELAY_SECONDS
+    return min(LLM_HEDGE_MAX_DELAY_SECONDS, max(LLM_HEDGE_MIN_DELAY_SECONDS, tracker.percentile(LLM_HEDGE_PERCENTILE)))
+
+
+async def _call_provider(name: str, system_prompt: str, user_prompt: str) -> str:
+    """
+    Chama o provedor registrando o resultado no circuit breaker e a latência.
+    A vaga já deve ter sido liberada por breakers[name].allow_request().
+    """
+    breaker = breakers[name]
+    started = time.perf_counter()
     try:
-        response = await primary_client.chat.completions.create(
-            model='gpt-4o-mini',
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            max_tokens=500,
-            temperature=0.7
-        )
-        return response.choices[0].message.content
-    except Exception as e_primary:
-        log.warning(f'Falha no LLM Primário (OpenAI): {e_primary}. Tentando fallback (Ollama).')
-        
-        # Em caso de falha no primário, tentar com o Ollama diretamente via httpx
+        result = await PROVIDERS[name](system_prompt, user_prompt)
+    except asyncio.CancelledError:
+        # Cancelada (perdeu a corrida do hedge ou o chamador desistiu): o tempo decorrido
+        # é um limite inferior da latência real. Descartá-lo eliminaria justamente as
+        # chamadas lentas e puxaria o percentil (e o atraso do hedge) para baixo
+        latencies[name].record(time.perf_counter() - started)
+        breaker.release()
+        raise
+    except Exception as e:
+        breaker.record_failure()
+        log.warning(f"Falha no provedor LLM '{name}': {e}")
+        raise
+    latencies[name].record(time.perf_counter() - started)
+    breaker.record_success()
+    return result
+
+
+def _available_providers() -> list:
+    """Provedores em ordem de preferência cujo circuit breaker libera a chamada."""
+    available = []
+    for name in PROVIDERS:
+        if breakers[name].allow_request():
+            available.append(name)
+        else:
+            log.info(f"Provedor LLM '{name}' ignorado: circuit breaker {breakers[name].state}")
+    return available
+
+
+async def _hedged_completion(primary: str, secondary: str, system_prompt: str, user_prompt: str) -> str:
+    """
+    Dispara o primário e, se ele não responder dentro de hedge_delay(primary),
+    a mesma requisição no secundário. Retorna a primeira resposta bem-sucedida
+    e cancela a outra; se o primário falhar antes do atraso, o secundário
+    é usado como fallback comum. Levanta a última exceção se ambos falharem.
+    """
+    delay = hedge_delay(primary)
+    primary_task = asyncio.create_task(_call_provider(primary, system_prompt, user_prompt))
+    secondary_task = None
+    try:
+        done, _ = await asyncio.wait({primary_task}, timeout=delay)
+        if done and primary_task.exception() is None:
+            return primary_task.result()
+
+        hedged = not done
+        if hedged:
+            _hedge_stats["hedged"] += 1
+            log.info(f"Hedge: '{primary}' sem resposta em {delay:.2f}s, disparando '{secondary}'")
+        secondary_task = asyncio.create_task(_call_provider(secondary, system_prompt, user_prompt))
+
+        pending = {task for task in (primary_task, secondary_task) if not task.done()}
+        last_error = primary_task.exception() if primary_task.done() else None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if hedged:
+                        _hedge_stats["primary_wins" if task is primary_task else "secondary_wins"] += 1
+                    return task.result()
+                last_error = task.exception()
+        raise last_error
+    finally:
+        # Cancelar a requisição perdedora (ou ambas, se quem chamou foi cancelado)
+        leftovers = [task for task in (primary_task, secondary_task) if task is not None and not task.done()]
+        for task in leftovers:
+            task.cancel()
+        await asyncio.gather(*leftovers, return_exceptions=True)
+        if secondary_task is None:
+            # O secundário não foi chamado: devolver a vaga reservada em _available_providers
+            breakers[secondary].release()
+
+
+async def get_resilient_chat_completion(system_prompt: str, user_prompt: str) -> str:
+    """
+    Tenta os provedores em ordem de preferência (OpenAI, depois Ollama),
+    pulando aqueles cujo circuit breaker está aberto: durante uma queda do
+    primário o tráfego vai direto ao secundário, sem esperar pelo timeout.
+    Com LLM_HEDGING_ENABLED, um primário lento (acima do percentil de sua
+    latência recente) é acompanhado de uma requisição ao secundário.
+    """
+    providers = _available_providers()
+    if LLM_HEDGING_ENABLED and len(providers) >= 2:
+        for unused in providers[2:]:
+            breakers[unused].release()
+        try:
+            return await _hedged_completion(providers[0], providers[1], system_prompt, user_prompt)
+        except Exception:
+            pass
+    else:
+        remaining = list(providers)
         try:
-            ollama_base_url = os.getenv("OLLAMA_API_BASE_URL")
-            ollama_model_name = os.getenv("OLLAMA_CHAT_MODEL_NAME")
-            
-            if not ollama_base_url or not ollama_model_name:
-                raise Exception("Variáveis de ambiente do Ollama não configuradas corretamente")
-            
-            payload = {
-                "model": ollama_model_name,
-                "messages": [
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                "stream": False,
-                "options": {
-                    "temperature": 0.7,
-                    "max_tokens": 500
-                }
+            while remaining:
+                name = remaining.pop(0)
+                try:
+                    return await _call_provider(name, system_prompt, user_prompt)
+                except Exception:
+                    continue
+        finally:
+            # Devolver as vagas de teste reservadas para provedores que não chegaram a ser chamados
+            for name in remaining:
+                breakers[name].release()
+
+    log.error('Nenhum provedor LLM disponível.')
+    return LLM_UNAVAILABLE_MESSAGE
+
+
+async def stream_resilient_chat_completion(system_prompt: str, user_prompt: str) -> AsyncIterator[str]:
+    """
+    Versão em streaming de get_resilient_chat_completion: produz os trechos
+    de texto à medida que são gerados. O failover entre provedores (respeitando
+    os circuit breakers) só é possível antes do primeiro trecho; uma falha
+    depois disso levanta LLMStreamInterrupted. Sem provedores disponíveis,
+    produz LLM_UNAVAILABLE_MESSAGE. Não há hedge no modo streaming.
+    """
+    remaining = _available_providers()
+    try:
+        while remaining:
+            name = remaining.pop(0)
+            breaker = breakers[name]
+            produced = False
+            try:
+                async for text in STREAMING_PROVIDERS[name](system_prompt, user_prompt):
+                    produced = True
+                    yield text
+            except (asyncio.CancelledError, GeneratorExit):
+                breaker.release()
+                raise
+            except Exception as e:
+                breaker.record_failure()
+                log.warning(f"Falha no provedor LLM '{name}' (streaming): {e}")
+                if produced:
+                    raise LLMStreamInterrupted(str(e)) from e
+                continue
+            breaker.record_success()
+            return
+    finally:
+        # Devolver as vagas de teste reservadas para provedores que não chegaram a ser chamados
+        for name in remaining:
+            breakers[name].release()
+
+    log.error('Nenhum provedor LLM disponível.')
+    yield LLM_UNAVAILABLE_MESSAGE
+
+
+def get_llm_provider_stats() -> dict:
+    """
+    Estado do circuit breaker, latências recentes e atraso de hedge de cada provedor
+    """
+    return {
+        "hedging_enabled": LLM_HEDGING_ENABLED,
+        "hedging": dict(_hedge_stats),
+        "providers": {
+            name: {
+                "breaker": breakers[name].stats(),
+                "latency": latencies[name].stats(),
+                "hedge_delay_seconds": hedge_delay(name),
             }
-            
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.post(
-                    f"{ollama_base_url.rstrip('/')}/chat/completions",
-                    json=payload,
-                    headers={"Content-Type": "application/json"}
-                )
-                
-                if response.status_code == 200:
-                    result = response.json()
-                    return result['choices'][0]['message']['content']
-                else:
-                    raise Exception(f"Erro na API do Ollama: {response.status_code} - {response.text}")
-                    
-        except Exception as e_fallback:
-            log.error(f'Falha no LLM de Fallback (Ollama): {e_fallback}.')
-            return 'Desculpe, nossos sistemas de IA estão temporariamente indisponíveis. Por favor, tente novamente em alguns instantes.'
\ No newline at end of file
+            for name in PROVIDERS
+        },
+    }
@@ -1,7 +1,9 @@
 from fastapi import FastAPI
+from core.http_clients import open_http_clients, close_http_clients
 from agent_service.api.retrieval import router as retrieval_router
 from agent_service.api.crm import router as crm_router
-from agent_service.api.orchestrator import router as orchestrator_router
+from agent_service.api.orchestrator import router as orchestrator_router, conversation_executor
+from agent_service.intent_classifier import warm_up_intent_classifier
 
 # Configuração da aplicação FastAPI
 app = FastAPI(
@@ -10,6 +12,36 @@ app = FastAPI(
     version="0.1.0"
 )
 
+# Executor das conversas recebidas pelo webhook (filas limitadas, N consumidores).
+# Encerrado antes dos clientes HTTP, pois as mensagens pendentes ainda enviam respostas
+@app.on_event("startup")
+async def startup_conversation_executor():
+    await conversation_executor.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_conversation_executor():
+    await conversation_executor.stop()
+
+
+# Centróides do classificador de intenção (embeddings dos exemplos) calculados
+# antes das primeiras mensagens
+@app.on_event("startup")
+async def startup_intent_classifier():
+    await warm_up_intent_classifier()
+
+
+# Clientes HTTP compartilhados (conexões reutilizadas entre requisições)
+@app.on_event("startup")
+async def startup_http_clients():
+    open_http_clients(["evoapi", "ollama"])
+
+
+@app.on_event("shutdown")
+async def shutdown_http_clients():
+    await close_http_clients()
+
+
 # Inclui as rotas definidas no módulo de retrieval
 app.include_router(retrieval_router)
 
@@ -0,0 +1,138 @@
+import logging
+import re
+from dataclasses import dataclass
+from typing import List, Optional, Sequence
+
+from core.config import RAG_CONTEXT_TOKEN_BUDGET, RAG_PROMPT_ENCODING, RAG_CONTEXT_MIN_TRUNCATED_TOKENS
+from core.tokenizer import get_encoding
+
+# Configuração do logger
+log = logging.getLogger(__name__)
+
+RAG_SYSTEM_PROMPT = "Você é um assistente útil que responde com base no contexto fornecido."
+
+# Separador entre os chunks no contexto
+CONTEXT_SEPARATOR = "\n\n"
+
+# Fim de frase: pontuação final seguida de espaço/quebra de linha (ou quebra de parágrafo)
+_SENTENCE_END = re.compile(r"[.!?…](?=\s)|\n\s*\n")
+
+# Sobreposição mínima (em caracteres) para considerar que dois chunks se repetem
+MIN_OVERLAP_CHARS = 40
+
+
+@dataclass
+class RagPrompt:
+    system_prompt: str
+    user_prompt: str
+    # Tokens do contexto e do prompt completo (system + user), pelo encoding do modelo
+    context_tokens: int
+    prompt_tokens: int
+    chunks_used: int
+    chunks_truncated: int
+    chunks_deduplicated: int
+    chunks_over_budget: int
+
+
+def _normalize_whitespace(text: str) -> str:
+    """Colapsa espaços repetidos, preservando as quebras de linha (limites de parágrafo)."""
+    return re.sub(r"[ \t]+", " ", text).strip()
+
+
+def _remove_overlap(selected: str, text: str) -> Optional[str]:
+    """
+    Remove de `text` o trecho que já aparece em `selected`: retorna None se
+    `text` estiver contido em `selected`; se o início de `text` repetir o fim
+    de `selected` (sobreposição do chunking), retorna apenas o restante.
+    """
+    if text in selected:
+        return None
+    probe = text[:MIN_OVERLAP_CHARS]
+    if len(probe) < MIN_OVERLAP_CHARS:
+        return text
+    start = selected.find(probe)
+    while start != -1:
+        overlap = len(selected) - start
+        if text.startswith(selected[start:]) and overlap >= MIN_OVERLAP_CHARS:
+            return text[overlap:].strip()
+        start = selected.find(probe, start + 1)
+    return text
+
+
+def truncate_at_sentence(text: str, max_tokens: int, encoding) -> str:
+    """
+    Corta `text` em até `max_tokens` tokens, terminando no último fim de frase
+    (ou parágrafo) dentro do limite; retorna "" se não houver fim de frase
+    """
+    tokens = encoding.encode(text)
+    if len(tokens) <= max_tokens:
+        return text
+    prefix = encoding.decode(tokens[:max_tokens])
+    ends = [match.end() for match in _SENTENCE_END.finditer(prefix)]
+    return prefix[:ends[-1]].strip() if ends else ""
+
+
+def build_rag_prompt(
+    query: str,
+    chunks: Sequence[str],
+    token_budget: int = RAG_CONTEXT_TOKEN_BUDGET,
+    encoding_name: str = RAG_PROMPT_ENCODING,
+) -> RagPrompt:
+    """
+    Monta o prompt de RAG com os chunks em ordem de relevância, dentro de
+    `token_budget` tokens de contexto: chunks repetidos ou sobrepostos aos já
+    incluídos são removidos, e o primeiro chunk que não cabe inteiro é
+    truncado em fim de frase (se sobrar espaço suficiente); os demais ficam de fora.
+    """
+    encoding = get_encoding(encoding_name)
+    separator_tokens = len(encoding.encode(CONTEXT_SEPARATOR))
+
+    selected: List[str] = []
+    used_tokens = 0
+    truncated = deduplicated = over_budget = 0
+
+    for position, chunk in enumerate(chunks):
+        text = _normalize_whitespace(chunk)
+        for previous in selected:
+            if not text:
+                break
+            text = _remove_overlap(previous, text)
+        if not text:
+            deduplicated += 1
+            continue
+
+        available = token_budget - used_tokens - (separator_tokens if selected else 0)
+        text_tokens = len(encoding.encode(text))
+        if text_tokens <= available:
+            selected.append(text)
+            used_tokens += text_tokens + (separator_tokens if len(selected) > 1 else 0)
+            continue
+
+        # Orçamento esgotado: truncar este chunk (se valer a pena) e descartar os seguintes
+        if available >= RAG_CONTEXT_MIN_TRUNCATED_TOKENS:
+            text = truncate_at_sentence(text, available, encoding)
+            if text:
+                selected.append(text)
+                used_tokens += len(encoding.encode(text)) + (separator_tokens if len(selected) > 1 else 0)
+                truncated += 1
+            else:
+                over_budget += 1
+        else:
+            over_budget += 1
+        over_budget += len(chunks) - position - 1
+        break
+
+    context_str = CONTEXT_SEPARATOR.join(selected)
+    user_prompt = f"""Contexto: {context_str}\n\nPergunta: {query}\n\nResponda com base no contexto fornecido. Se não encontrar informações relevantes no contexto, diga que não encontrou informações suficientes para responder."""
+    prompt_tokens = len(encoding.encode(RAG_SYSTEM_PROMPT)) + len(encoding.encode(user_prompt))
+
+    return RagPrompt(
+        system_prompt=RAG_SYSTEM_PROMPT,
+        user_prompt=user_prompt,
+        context_tokens=used_tokens,
+        prompt_tokens=prompt_tokens,
+        chunks_used=len(selected),
+        chunks_truncated=truncated,
+        chunks_deduplicated=deduplicated,
+        chunks_over_budget=over_budget,
+    )
@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import List, Optional
+from pydantic import BaseModel, Field
+from typing import List, Literal, Optional
 from datetime import datetime
 from core.models import PyTicketStatus
 
@@ -7,12 +7,25 @@ from core.models import PyTicketStatus
 class RetrievalRequest(BaseModel):
     query: str
     namespace: Optional[str] = None
+    # Tamanho da lista de candidatos do índice HNSW (maior = mais recall, mais latência)
+    ef_search: Optional[int] = Field(default=None, ge=1, le=1000)
+    # "vector": similaridade de embeddings; "hybrid": full-text (português) + vetorial com fusão RRF
+    mode: Literal['vector', 'hybrid'] = 'vector'
+    top_k: int = Field(default=3, ge=1, le=50)
+    # Distância de cosseno máxima aceita (apenas no modo "vector"); None = sem limite
+    max_distance: Optional[float] = Field(default=None, gt=0, le=2)
+    # Rerank por Maximal Marginal Relevance sobre mmr_fetch_k candidatos (padrão: top_k * RAG_MMR_FETCH_MULTIPLIER)
+    mmr: bool = False
+    mmr_lambda: Optional[float] = Field(default=None, ge=0, le=1)
+    mmr_fetch_k: Optional[int] = Field(default=None, ge=1, le=200)
 
 
 class RetrievalChunk(BaseModel):
     content: str
     source_uri: str
     distance: float
+    # Pontuação da fusão de rankings (apenas no modo "hybrid")
+    score: Optional[float] = None
 
 
 class RetrievalResponse(BaseModel):
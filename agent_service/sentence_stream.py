@@ -0,0 +1,51 @@
+import re
+from typing import AsyncIterable, AsyncIterator, Optional
+
+from core.config import WHATSAPP_STREAM_MIN_CHARS, WHATSAPP_STREAM_MAX_CHARS
+
+# Fim de frase (pontuação final seguida de espaço) ou de parágrafo. O espaço
+# seguinte precisa já ter chegado, para não cortar "3.5" ou "..." pela metade.
+_BOUNDARY = re.compile(r"[.!?…]+[\"')\]]*(?=\s)|\n\s*\n")
+
+
+def _find_cut(buffer: str, min_chars: int, max_chars: int) -> Optional[int]:
+    """
+    Posição em que o buffer pode ser enviado: o primeiro fim de frase a partir
+    de `min_chars`; sem ele, o último espaço antes de `max_chars` (se excedido)
+    """
+    for match in _BOUNDARY.finditer(buffer):
+        if match.end() >= min_chars:
+            return match.end()
+    if len(buffer) > max_chars:
+        space = buffer.rfind(" ", 0, max_chars)
+        return space if space > 0 else max_chars
+    return None
+
+
+async def iter_sentence_messages(
+    chunks: AsyncIterable[str],
+    min_chars: int = WHATSAPP_STREAM_MIN_CHARS,
+    max_chars: int = WHATSAPP_STREAM_MAX_CHARS,
+) -> AsyncIterator[str]:
+    """
+    Agrupa os trechos gerados pelo LLM em mensagens formadas por frases
+    completas, cada uma com pelo menos `min_chars` caracteres (a última pode
+    ser menor). Se a geração falhar, o texto já recebido é produzido antes de
+    a exceção ser propagada.
+    """
+    buffer = ""
+    try:
+        async for text in chunks:
+            buffer += text
+            cut = _find_cut(buffer, min_chars, max_chars)
+            while cut is not None:
+                message, buffer = buffer[:cut].strip(), buffer[cut:].lstrip()
+                if message:
+                    yield message
+                cut = _find_cut(buffer, min_chars, max_chars)
+    except Exception:
+        if buffer.strip():
+            yield buffer.strip()
+        raise
+    if buffer.strip():
+        yield buffer.strip()
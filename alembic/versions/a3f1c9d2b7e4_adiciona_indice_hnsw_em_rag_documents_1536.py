@@ -0,0 +1,36 @@
+"""Adiciona índice HNSW (vector_cosine_ops) em ai.rag_documents_1536
+
+Revision ID: a3f1c9d2b7e4
+Revises: 8c18d11615bb
+Create Date: 2026-10-18 09:12:44.381502
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a3f1c9d2b7e4'
+down_revision: Union[str, Sequence[str], None] = '8c18d11615bb'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # CREATE INDEX CONCURRENTLY não pode rodar dentro de uma transação,
+    # então usamos um bloco em autocommit para não travar escritas na tabela.
+    with op.get_context().autocommit_block():
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_ai_rag_documents_1536_embedding_hnsw "
+            "ON ai.rag_documents_1536 USING hnsw (embedding vector_cosine_ops) "
+            "WITH (m = 16, ef_construction = 64)"
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ai.ix_ai_rag_documents_1536_embedding_hnsw")
@@ -0,0 +1,37 @@
+"""Adiciona dispatched_at em ai.ingestion_queue (reivindicação do despacho)
+
+Revision ID: a6d3e8f1c2b9
+Revises: f2c7a9e4b1d3
+Create Date: 2026-10-18 20:12:44.581302
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a6d3e8f1c2b9'
+down_revision: Union[str, Sequence[str], None] = 'f2c7a9e4b1d3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('ingestion_queue', sa.Column('dispatched_at', sa.DateTime(), nullable=True), schema='ai')
+    # Até aqui o varredor registrava o último despacho em updated_at
+    op.execute("UPDATE ai.ingestion_queue SET dispatched_at = updated_at WHERE status = 'PENDING'")
+    with op.get_context().autocommit_block():
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_ai_ingestion_queue_pending_dispatched_at "
+            "ON ai.ingestion_queue (dispatched_at) WHERE status = 'PENDING'"
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ai.ix_ai_ingestion_queue_pending_dispatched_at")
+    op.drop_column('ingestion_queue', 'dispatched_at', schema='ai')
@@ -0,0 +1,31 @@
+"""Adiciona chunk_hashes em ai.semantic_answer_cache (validade pelo conteúdo citado)
+
+Revision ID: b5e9f3a7c1d8
+Revises: a6d3e8f1c2b9
+Create Date: 2026-10-18 20:41:09.117254
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b5e9f3a7c1d8'
+down_revision: Union[str, Sequence[str], None] = 'a6d3e8f1c2b9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Entradas existentes não têm os hashes para validação; o cache é descartável
+    op.execute("DELETE FROM ai.semantic_answer_cache")
+    op.add_column('semantic_answer_cache', sa.Column('chunk_hashes', postgresql.ARRAY(sa.String(length=64)), nullable=False), schema='ai')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('semantic_answer_cache', 'chunk_hashes', schema='ai')
@@ -0,0 +1,44 @@
+"""Adiciona ai.embedding_cache (cache de embeddings por hash de conteúdo e modelo)
+
+Revision ID: b7d24e6a9c10
+Revises: a3f1c9d2b7e4
+Create Date: 2026-10-18 10:03:27.590114
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import pgvector.sqlalchemy
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7d24e6a9c10'
+down_revision: Union[str, Sequence[str], None] = 'a3f1c9d2b7e4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('embedding_cache',
+    sa.Column('content_sha256', sa.String(length=64), nullable=False),
+    sa.Column('model', sa.String(), nullable=False),
+    sa.Column('embedding', pgvector.sqlalchemy.vector.VECTOR(dim=1536), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('content_sha256', 'model'),
+    schema='ai'
+    )
+    # Popular o cache com os embeddings já calculados (todos gerados com text-embedding-3-small)
+    op.execute(
+        "INSERT INTO ai.embedding_cache (content_sha256, model, embedding, created_at) "
+        "SELECT DISTINCT ON (content_sha256) content_sha256, 'text-embedding-3-small', embedding, now() "
+        "FROM ai.rag_documents_1536 WHERE embedding IS NOT NULL "
+        "ORDER BY content_sha256, id "
+        "ON CONFLICT DO NOTHING"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('embedding_cache', schema='ai')
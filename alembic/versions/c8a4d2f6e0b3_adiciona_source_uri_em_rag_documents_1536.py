@@ -0,0 +1,47 @@
+"""Promove source_uri a coluna em ai.rag_documents_1536 e deduplica por fonte
+
+Revision ID: c8a4d2f6e0b3
+Revises: b5e9f3a7c1d8
+Create Date: 2026-10-18 21:26:51.804417
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c8a4d2f6e0b3'
+down_revision: Union[str, Sequence[str], None] = 'b5e9f3a7c1d8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('rag_documents_1536', sa.Column('source_uri', sa.String(), nullable=True), schema='ai')
+    op.execute("UPDATE ai.rag_documents_1536 SET source_uri = document_metadata->>'source_uri'")
+    # Cada fonte passa a ser dona dos seus chunks: o mesmo conteúdo em duas fontes
+    # gera uma linha por fonte (o embedding é reaproveitado via ai.embedding_cache).
+    # A constraint também indexa (namespace, source_uri) para a remoção de chunks obsoletos.
+    op.drop_constraint('uq_namespace_content_hash', 'rag_documents_1536', schema='ai', type_='unique')
+    op.create_unique_constraint(
+        'uq_namespace_source_content_hash', 'rag_documents_1536',
+        ['namespace', 'source_uri', 'content_sha256'], schema='ai'
+    )
+    # Chunks compartilhados foram gravados só na primeira fonte: esquecer os validadores
+    # para que a próxima ingestão de cada fonte seja completa e recrie as suas linhas
+    op.execute("DELETE FROM ai.ingestion_source_state")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # Voltar à unicidade por namespace exige remover as cópias do mesmo conteúdo
+    op.execute(
+        "DELETE FROM ai.rag_documents_1536 d USING ai.rag_documents_1536 o "
+        "WHERE d.namespace = o.namespace AND d.content_sha256 = o.content_sha256 AND d.id > o.id"
+    )
+    op.drop_constraint('uq_namespace_source_content_hash', 'rag_documents_1536', schema='ai', type_='unique')
+    op.create_unique_constraint('uq_namespace_content_hash', 'rag_documents_1536', ['namespace', 'content_sha256'], schema='ai')
+    op.drop_column('rag_documents_1536', 'source_uri', schema='ai')
@@ -0,0 +1,29 @@
+"""Adiciona índice (namespace, source_uri) em ai.ingestion_queue
+
+Revision ID: c91e5b3f0a42
+Revises: b7d24e6a9c10
+Create Date: 2026-10-18 11:20:51.774203
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c91e5b3f0a42'
+down_revision: Union[str, Sequence[str], None] = 'b7d24e6a9c10'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Usado na deduplicação da ingestão em massa (URIs já enfileiradas no namespace)
+    op.create_index('ix_ai_ingestion_queue_namespace_source_uri', 'ingestion_queue', ['namespace', 'source_uri'], unique=False, schema='ai')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_ai_ingestion_queue_namespace_source_uri', table_name='ingestion_queue', schema='ai')
@@ -0,0 +1,43 @@
+"""Adiciona coluna tsvector (portuguese) e índice GIN em ai.rag_documents_1536
+
+Revision ID: d4a8f27c6e15
+Revises: c91e5b3f0a42
+Create Date: 2026-10-18 13:41:09.052387
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd4a8f27c6e15'
+down_revision: Union[str, Sequence[str], None] = 'c91e5b3f0a42'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Coluna gerada (STORED): o Postgres mantém o tsvector sincronizado com 'content'.
+    # Atenção: a adição reescreve a tabela.
+    op.add_column('rag_documents_1536',
+        sa.Column('content_tsv', postgresql.TSVECTOR(),
+                  sa.Computed("to_tsvector('portuguese'::regconfig, content)", persisted=True),
+                  nullable=True),
+        schema='ai'
+    )
+    with op.get_context().autocommit_block():
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_ai_rag_documents_1536_content_tsv "
+            "ON ai.rag_documents_1536 USING gin (content_tsv)"
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ai.ix_ai_rag_documents_1536_content_tsv")
+    op.drop_column('rag_documents_1536', 'content_tsv', schema='ai')
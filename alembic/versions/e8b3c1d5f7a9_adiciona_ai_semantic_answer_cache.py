@@ -0,0 +1,48 @@
+"""Adiciona ai.semantic_answer_cache (cache semântico de respostas)
+
+Revision ID: e8b3c1d5f7a9
+Revises: d4a8f27c6e15
+Create Date: 2026-10-18 15:02:36.418920
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import pgvector.sqlalchemy
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e8b3c1d5f7a9'
+down_revision: Union[str, Sequence[str], None] = 'd4a8f27c6e15'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('semantic_answer_cache',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('namespace', sa.String(), nullable=False),
+    sa.Column('query_text', sa.Text(), nullable=False),
+    sa.Column('embedding', pgvector.sqlalchemy.vector.VECTOR(dim=1536), nullable=False),
+    sa.Column('chunk_ids', postgresql.ARRAY(sa.Integer()), nullable=False),
+    sa.Column('answer', sa.Text(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('expires_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    schema='ai'
+    )
+    op.create_index(op.f('ix_ai_semantic_answer_cache_namespace'), 'semantic_answer_cache', ['namespace'], unique=False, schema='ai')
+    op.create_index('ix_ai_semantic_answer_cache_embedding_hnsw', 'semantic_answer_cache', ['embedding'], unique=False, schema='ai',
+                    postgresql_using='hnsw',
+                    postgresql_with={'m': 16, 'ef_construction': 64},
+                    postgresql_ops={'embedding': 'vector_cosine_ops'})
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_ai_semantic_answer_cache_embedding_hnsw', table_name='semantic_answer_cache', schema='ai')
+    op.drop_index(op.f('ix_ai_semantic_answer_cache_namespace'), table_name='semantic_answer_cache', schema='ai')
+    op.drop_table('semantic_answer_cache', schema='ai')
@@ -0,0 +1,37 @@
+"""Adiciona ai.ingestion_source_state (reingestão condicional)
+
+Revision ID: f2c7a9e4b1d3
+Revises: e8b3c1d5f7a9
+Create Date: 2026-10-18 18:41:09.203517
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2c7a9e4b1d3'
+down_revision: Union[str, Sequence[str], None] = 'e8b3c1d5f7a9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('ingestion_source_state',
+    sa.Column('namespace', sa.String(), nullable=False),
+    sa.Column('source_uri', sa.String(), nullable=False),
+    sa.Column('etag', sa.String(), nullable=True),
+    sa.Column('last_modified', sa.String(), nullable=True),
+    sa.Column('content_sha256', sa.String(length=64), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('namespace', 'source_uri'),
+    schema='ai'
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('ingestion_source_state', schema='ai')
@@ -0,0 +1,66 @@
+import asyncio
+import statistics
+import sys
+import time
+
+from sqlalchemy import text
+
+from core.database import build_async_engine, build_session_factory
+
+# Benchmark de latência por "requisição" (abrir sessão + consulta simples + commit)
+# comparando o pool de conexões ("queue") com o comportamento antigo (NullPool).
+# Uso: python benchmark_db_pool.py [requisicoes] [concorrencia]
+REQUESTS = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+CONCURRENCY = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+
+
+async def simulate_request(session_factory, latencies: list):
+    start = time.perf_counter()
+    async with session_factory() as session:
+        await session.execute(text("SELECT 1"))
+        await session.commit()
+    latencies.append((time.perf_counter() - start) * 1000)
+
+
+async def run_benchmark(pool_mode: str) -> dict:
+    engine = build_async_engine(pool_mode)
+    session_factory = build_session_factory(engine)
+    latencies = []
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+
+    async def bounded():
+        async with semaphore:
+            await simulate_request(session_factory, latencies)
+
+    try:
+        # Aquecimento (não contabilizado)
+        await simulate_request(session_factory, [])
+        start = time.perf_counter()
+        await asyncio.gather(*(bounded() for _ in range(REQUESTS)))
+        elapsed = time.perf_counter() - start
+    finally:
+        await engine.dispose()
+
+    latencies.sort()
+    return {
+        "mode": pool_mode,
+        "p50_ms": statistics.median(latencies),
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1],
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1],
+        "req_per_s": REQUESTS / elapsed,
+    }
+
+
+async def main():
+    print(f"Requisições: {REQUESTS} | Concorrência: {CONCURRENCY}")
+    for pool_mode in ("null", "queue"):
+        result = await run_benchmark(pool_mode)
+        print(
+            f"{result['mode']:>5}: p50={result['p50_ms']:.2f}ms "
+            f"p95={result['p95_ms']:.2f}ms p99={result['p99_ms']:.2f}ms "
+            f"throughput={result['req_per_s']:.1f} req/s"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
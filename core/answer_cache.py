@@ -0,0 +1,118 @@
+import logging
+from datetime import datetime, timedelta
+from typing import List, Optional, Sequence
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .config import SEMANTIC_ANSWER_CACHE_MAX_DISTANCE, SEMANTIC_ANSWER_CACHE_TTL_SECONDS
+from .models import RagDocuments1536, SemanticAnswerCache
+
+# Configuração do logger
+log = logging.getLogger(__name__)
+
+# Chave usada quando a pergunta foi respondida consultando todos os namespaces
+ALL_NAMESPACES = '*'
+
+# Contadores do processo (para monitoramento)
+_stats = {"hits": 0, "misses": 0, "stale": 0, "stored": 0}
+
+
+def _namespace_key(namespace: Optional[str]) -> str:
+    return namespace or ALL_NAMESPACES
+
+
+async def lookup_cached_answer(
+    session: AsyncSession,
+    query_vector: List[float],
+    namespace: Optional[str],
+    max_distance: float = SEMANTIC_ANSWER_CACHE_MAX_DISTANCE,
+) -> Optional[str]:
+    """
+    Procura uma resposta já gerada para uma pergunta semanticamente equivalente
+    (distância de cosseno <= `max_distance`) no mesmo namespace e ainda válida.
+    A resposta só é reutilizada se o conteúdo de todos os chunks usados para gerá-la
+    (identificado pelo SHA256) ainda existir; chunks removidos ou alterados por uma
+    reingestão invalidam a entrada.
+    """
+    distance = SemanticAnswerCache.embedding.cosine_distance(query_vector).label('distance')
+    stmt = select(SemanticAnswerCache, distance).filter(
+        SemanticAnswerCache.namespace == _namespace_key(namespace),
+        SemanticAnswerCache.expires_at > datetime.utcnow()
+    ).order_by('distance').limit(1)
+    row = (await session.execute(stmt)).first()
+
+    if row is None or row.distance > max_distance:
+        _stats["misses"] += 1
+        return None
+
+    entry = row.SemanticAnswerCache
+    cited_hashes = set(entry.chunk_hashes)
+    stmt = select(func.count(func.distinct(RagDocuments1536.content_sha256))).filter(
+        RagDocuments1536.content_sha256.in_(cited_hashes)
+    )
+    if entry.namespace != ALL_NAMESPACES:
+        stmt = stmt.filter(RagDocuments1536.namespace == entry.namespace)
+    existing = await session.scalar(stmt)
+    if existing != len(cited_hashes):
+        # O contexto usado na resposta mudou: descartar a entrada
+        await session.execute(delete(SemanticAnswerCache).filter(SemanticAnswerCache.id == entry.id))
+        _stats["stale"] += 1
+        _stats["misses"] += 1
+        return None
+
+    _stats["hits"] += 1
+    log.info(f"Cache semântico: resposta reutilizada (distância={row.distance:.4f}, entrada={entry.id})")
+    return entry.answer
+
+
+async def store_answer(
+    session: AsyncSession,
+    query: str,
+    query_vector: List[float],
+    namespace: Optional[str],
+    chunk_ids: Sequence[int],
+    chunk_hashes: Sequence[str],
+    answer: str,
+    ttl_seconds: float = SEMANTIC_ANSWER_CACHE_TTL_SECONDS,
+) -> None:
+    """
+    Grava a resposta gerada e os chunks usados como contexto, com o SHA256
+    do conteúdo de cada um (sem commit).
+    Entradas expiradas do namespace são removidas na mesma ocasião.
+    """
+    now = datetime.utcnow()
+    key = _namespace_key(namespace)
+    await session.execute(delete(SemanticAnswerCache).filter(
+        SemanticAnswerCache.namespace == key,
+        SemanticAnswerCache.expires_at <= now
+    ))
+    session.add(SemanticAnswerCache(
+        namespace=key,
+        query_text=query,
+        embedding=query_vector,
+        chunk_ids=list(chunk_ids),
+        chunk_hashes=list(chunk_hashes),
+        answer=answer,
+        created_at=now,
+        expires_at=now + timedelta(seconds=ttl_seconds),
+    ))
+    _stats["stored"] += 1
+
+
+async def invalidate_namespace(session: AsyncSession, namespace: Optional[str]) -> None:
+    """
+    Remove as respostas em cache afetadas por uma (re)ingestão no namespace,
+    incluindo as geradas com busca em todos os namespaces (sem commit)
+    """
+    await session.execute(delete(SemanticAnswerCache).filter(
+        SemanticAnswerCache.namespace.in_({_namespace_key(namespace), ALL_NAMESPACES})
+    ))
+
+
+def get_answer_cache_stats() -> dict:
+    total = _stats["hits"] + _stats["misses"]
+    return {
+        **_stats,
+        "hit_rate": (_stats["hits"] / total) if total else 0.0,
+    }
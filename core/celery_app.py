@@ -1,5 +1,11 @@
 from celery import Celery
-from core.config import CELERY_BROKER_URL, CELERY_RESULT_BACKEND
+from core.config import (
+    CELERY_BROKER_URL,
+    CELERY_RESULT_BACKEND,
+    CELERY_WORKER_POOL,
+    CELERY_WORKER_CONCURRENCY,
+    INGESTION_SWEEPER_INTERVAL_SECONDS,
+)
 
 # Cria a instância principal do Celery
 celery_app = Celery(
@@ -14,14 +20,36 @@ celery_app.conf.update(
     task_track_started=True,
     timezone='UTC',
     enable_utc=True,
-    worker_pool='solo',  # Usar pool solo para suporte adequado a tarefas assíncronas em Windows
+    # Pool "threads" (também compatível com Windows): cada thread submete o job ao
+    # event loop persistente do processo, permitindo N ingestões simultâneas
+    worker_pool=CELERY_WORKER_POOL,
+    worker_concurrency=CELERY_WORKER_CONCURRENCY,
+    worker_prefetch_multiplier=1,
 )
 
 # Configuração do Celery Beat (Agendador de Tarefas)
-# Vamos configurar uma tarefa para rodar a cada 10 segundos
+# Os jobs são despachados diretamente pela API de ingestão; o Beat roda apenas
+# o varredor que reenfileira jobs PENDING cujo despacho se perdeu
 celery_app.conf.beat_schedule = {
-    'schedule-job-processor-every-10-seconds': {
+    'sweep-pending-ingestion-jobs': {
         'task': 'tasks.schedule_job_processor',
-        'schedule': 10.0,  # Em segundos
+        'schedule': INGESTION_SWEEPER_INTERVAL_SECONDS,  # Em segundos
     },
-}
\ No newline at end of file
+}
+
+
+def enqueue_ingestion_job(job_id: int) -> None:
+    """
+    Enfileira o processamento de um job de ingestão pelo nome da tarefa,
+    sem importar o código do worker no processo da API
+    """
+    celery_app.send_task('tasks.process_ingestion_job', args=[job_id])
+
+
+def enqueue_ingestion_jobs(job_ids: list) -> None:
+    """
+    Enfileira vários jobs reutilizando uma única conexão com o broker
+    """
+    with celery_app.producer_or_acquire() as producer:
+        for job_id in job_ids:
+            celery_app.send_task('tasks.process_ingestion_job', args=[job_id], producer=producer)
\ No newline at end of file
@@ -1,22 +1,62 @@
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
-from sqlalchemy import pool
-from typing import AsyncGenerator
-from .config import DATABASE_URL
-
-# Engine de conexão assíncrona
-async_engine = create_async_engine(
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession, AsyncEngine
+from sqlalchemy import pool, text
+from typing import AsyncGenerator, Optional
+from .config import (
     DATABASE_URL,
-    echo=True,
-    poolclass=pool.NullPool
+    RAG_HNSW_EF_SEARCH,
+    DB_POOL_MODE,
+    DB_POOL_SIZE,
+    DB_MAX_OVERFLOW,
+    DB_POOL_TIMEOUT,
+    DB_POOL_RECYCLE,
+    DB_POOL_PRE_PING,
+    DB_ECHO,
 )
 
+
+def build_async_engine(pool_mode: str = DB_POOL_MODE) -> AsyncEngine:
+    """
+    Cria um engine assíncrono conforme a configuração de pool.
+    - "queue": pool de conexões reutilizáveis (pre-ping e recycle configuráveis)
+    - "null": uma conexão nova por sessão, fechada ao final (NullPool)
+    """
+    if pool_mode == "null":
+        return create_async_engine(
+            DATABASE_URL,
+            echo=DB_ECHO,
+            poolclass=pool.NullPool
+        )
+    if pool_mode != "queue":
+        raise ValueError(f"DB_POOL_MODE inválido: {pool_mode!r} (use 'queue' ou 'null')")
+
+    return create_async_engine(
+        DATABASE_URL,
+        echo=DB_ECHO,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+    )
+
+
+def build_session_factory(engine: AsyncEngine) -> async_sessionmaker:
+    """
+    Fábrica de sessões com as opções padrão do projeto
+    """
+    return async_sessionmaker(
+        bind=engine,
+        autoflush=False,
+        autocommit=False,
+        expire_on_commit=False,
+    )
+
+
+# Engine de conexão assíncrona (compartilhado pelo processo da API)
+async_engine = build_async_engine()
+
 # Fábrica de sessões assíncronas
-AsyncSessionFactory = async_sessionmaker(
-    bind=async_engine,
-    autoflush=False,
-    autocommit=False,
-    expire_on_commit=False,
-)
+AsyncSessionFactory = build_session_factory(async_engine)
 
 async def get_db() -> AsyncGenerator[AsyncSession, None]:
     """
@@ -35,3 +75,15 @@ async def get_db() -> AsyncGenerator[AsyncSession, None]:
             await session.rollback()
             raise
         # O 'async with' garante que session.close() seja chamado.
+
+
+async def set_hnsw_ef_search(session: AsyncSession, ef_search: Optional[int] = None) -> None:
+    """
+    Ajusta o parâmetro hnsw.ef_search apenas para a transação corrente
+    (equivalente a SET LOCAL), permitindo trocar recall por latência por requisição.
+    """
+    value = ef_search or RAG_HNSW_EF_SEARCH
+    await session.execute(
+        text("SELECT set_config('hnsw.ef_search', :value, true)"),
+        {"value": str(value)}
+    )
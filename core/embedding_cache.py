@@ -0,0 +1,54 @@
+import hashlib
+from datetime import datetime
+from typing import Dict, Iterable, List
+
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .models import EmbeddingCache
+
+
+def content_hash(text: str) -> str:
+    """
+    Hash SHA256 (UTF-8) usado como chave do cache - o mesmo de rag_documents_1536.content_sha256
+    """
+    return hashlib.sha256(text.encode('utf-8', errors='replace')).hexdigest()
+
+
+async def get_cached_embeddings(session: AsyncSession, hashes: Iterable[str], model: str) -> Dict[str, List[float]]:
+    """
+    Busca no cache os embeddings já calculados para os hashes informados.
+    Retorna um dicionário {content_sha256: embedding} apenas com os acertos.
+    """
+    hashes = list(set(hashes))
+    if not hashes:
+        return {}
+
+    stmt = select(EmbeddingCache.content_sha256, EmbeddingCache.embedding).filter(
+        EmbeddingCache.model == model,
+        EmbeddingCache.content_sha256.in_(hashes)
+    )
+    result = await session.execute(stmt)
+    # O pgvector devolve numpy.ndarray: converter para float nativo (serializável em JSON, ex.: Redis)
+    return {row[0]: [float(value) for value in row[1]] for row in result.all()}
+
+
+async def store_embeddings(session: AsyncSession, embeddings: Dict[str, List[float]], model: str) -> None:
+    """
+    Grava embeddings no cache (sem commit). Conflitos de chave são ignorados,
+    pois o embedding de um mesmo conteúdo/modelo é determinístico.
+    """
+    if not embeddings:
+        return
+
+    stmt = insert(EmbeddingCache).values([
+        {
+            'content_sha256': sha,
+            'model': model,
+            'embedding': embedding,
+            'created_at': datetime.utcnow(),
+        }
+        for sha, embedding in embeddings.items()
+    ]).on_conflict_do_nothing(index_elements=['content_sha256', 'model'])
+    await session.execute(stmt)
@@ -0,0 +1,85 @@
+import logging
+from typing import Dict, Iterable
+
+import httpx
+
+from core.config import (
+    HTTP_CLIENT_HTTP2,
+    HTTP_CONNECT_TIMEOUT_SECONDS,
+    EVOAPI_TIMEOUT_SECONDS,
+    UNSTRUCTURED_TIMEOUT_SECONDS,
+    DOWNLOAD_TIMEOUT_SECONDS,
+    OLLAMA_TIMEOUT_SECONDS,
+)
+
+# Configuração do logger
+log = logging.getLogger(__name__)
+
+# HTTP/2 exige o pacote opcional 'h2' (httpx[http2])
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# Configuração por upstream: timeouts explícitos, limites do pool e uso de HTTP/2
+UPSTREAMS = {
+    "evoapi": {
+        "timeout": httpx.Timeout(EVOAPI_TIMEOUT_SECONDS, connect=HTTP_CONNECT_TIMEOUT_SECONDS),
+        "limits": httpx.Limits(max_connections=50, max_keepalive_connections=20, keepalive_expiry=60),
+        "http2": True,
+    },
+    "ollama": {
+        "timeout": httpx.Timeout(OLLAMA_TIMEOUT_SECONDS, connect=HTTP_CONNECT_TIMEOUT_SECONDS),
+        "limits": httpx.Limits(max_connections=20, max_keepalive_connections=10, keepalive_expiry=60),
+        "http2": False,
+    },
+    "unstructured": {
+        "timeout": httpx.Timeout(UNSTRUCTURED_TIMEOUT_SECONDS, connect=HTTP_CONNECT_TIMEOUT_SECONDS),
+        "limits": httpx.Limits(max_connections=16, max_keepalive_connections=8, keepalive_expiry=60),
+        "http2": False,
+    },
+    "download": {
+        "timeout": httpx.Timeout(DOWNLOAD_TIMEOUT_SECONDS, connect=HTTP_CONNECT_TIMEOUT_SECONDS),
+        "limits": httpx.Limits(max_connections=32, max_keepalive_connections=16, keepalive_expiry=30),
+        "http2": True,
+        "follow_redirects": True,
+    },
+}
+
+# Clientes do processo (um por upstream). Devem ser usados sempre no mesmo event loop.
+_clients: Dict[str, httpx.AsyncClient] = {}
+
+
+def get_http_client(name: str) -> httpx.AsyncClient:
+    """
+    Retorna o cliente HTTP compartilhado do upstream `name`, criando-o na
+    primeira chamada. As conexões (TCP/TLS) ficam abertas e são reutilizadas.
+    """
+    client = _clients.get(name)
+    if client is None or client.is_closed:
+        options = dict(UPSTREAMS[name])
+        options["http2"] = options.get("http2", False) and HTTP_CLIENT_HTTP2 and HTTP2_AVAILABLE
+        client = httpx.AsyncClient(**options)
+        _clients[name] = client
+    return client
+
+
+def open_http_clients(names: Iterable[str]) -> None:
+    """
+    Cria antecipadamente os clientes dos upstreams informados (ex.: no startup da API)
+    """
+    for name in names:
+        get_http_client(name)
+
+
+async def close_http_clients() -> None:
+    """
+    Fecha todos os clientes HTTP do processo (shutdown da API / do worker)
+    """
+    for name, client in list(_clients.items()):
+        try:
+            await client.aclose()
+        except Exception as e:
+            log.warning(f"Falha ao fechar cliente HTTP '{name}': {e}")
+    _clients.clear()
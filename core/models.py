@@ -1,5 +1,5 @@
 from datetime import datetime
-from sqlalchemy import (Column, Integer, String, DateTime, Text, UniqueConstraint, JSON, ForeignKey, Boolean)
+from sqlalchemy import (Column, Integer, String, DateTime, Text, UniqueConstraint, JSON, ForeignKey, Boolean, Index, Computed, text)
 from sqlalchemy.orm import declarative_base, relationship
 from pgvector.sqlalchemy import Vector
 from sqlalchemy.dialects import postgresql
@@ -9,6 +9,9 @@ from enum import Enum
 
 Base = declarative_base()
 
+# Configuração de texto do Postgres usada no tsvector de rag_documents_1536
+RAG_FTS_CONFIG = 'portuguese'
+
 # Schema definitions
 ai_schema = 'ai'
 crm_schema = 'crm'
@@ -37,7 +40,16 @@ pg_ticket_status = postgresql.ENUM(PyTicketStatus, name='ticketstatus', schema=c
 
 class IngestionQueue(Base):
     __tablename__ = 'ingestion_queue'
-    __table_args__ = {'schema': ai_schema}
+    __table_args__ = (
+        Index('ix_ai_ingestion_queue_namespace_source_uri', 'namespace', 'source_uri'),
+        # Usado pelo varredor para encontrar despachos PENDING perdidos
+        Index(
+            'ix_ai_ingestion_queue_pending_dispatched_at',
+            'dispatched_at',
+            postgresql_where=text("status = 'PENDING'"),
+        ),
+        {'schema': ai_schema},
+    )
 
     id = Column(Integer, primary_key=True)
     source_uri = Column(String, nullable=False)
@@ -45,20 +57,88 @@ class IngestionQueue(Base):
     status = Column(pg_ingestion_status, nullable=False, default=PyIngestionStatus.PENDING)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Último envio do job ao broker (API ou varredor); NULL = ainda não despachado
+    dispatched_at = Column(DateTime)
     processing_log = Column(Text)
 
 class RagDocuments1536(Base):  # Renamed to match table name exactly
     __tablename__ = 'rag_documents_1536'
-    __table_args__ = (UniqueConstraint('namespace', 'content_sha256', name='uq_namespace_content_hash'), {'schema': ai_schema})
+    __table_args__ = (
+        # Chunks pertencem a uma fonte: o mesmo conteúdo em duas fontes são duas linhas
+        UniqueConstraint('namespace', 'source_uri', 'content_sha256', name='uq_namespace_source_content_hash'),
+        # Índice ANN (HNSW) para a busca por distância de cosseno
+        Index(
+            'ix_ai_rag_documents_1536_embedding_hnsw',
+            'embedding',
+            postgresql_using='hnsw',
+            postgresql_with={'m': 16, 'ef_construction': 64},
+            postgresql_ops={'embedding': 'vector_cosine_ops'},
+        ),
+        # Índice de busca textual (full-text search em português)
+        Index('ix_ai_rag_documents_1536_content_tsv', 'content_tsv', postgresql_using='gin'),
+        {'schema': ai_schema},
+    )
 
     id = Column(Integer, primary_key=True)
     namespace = Column(String, nullable=False, index=True)
+    source_uri = Column(String)
     content = Column(Text, nullable=False)
     content_sha256 = Column(String(64), nullable=False, index=True)
     embedding = Column(Vector(1536))  # Tamanho para text-embedding-3-small
+    # tsvector gerado pelo Postgres a partir de 'content' (busca híbrida léxica + vetorial)
+    content_tsv = Column(postgresql.TSVECTOR, Computed(f"to_tsvector('{RAG_FTS_CONFIG}'::regconfig, content)", persisted=True))
     document_metadata = Column(JSON)
     created_at = Column(DateTime, default=datetime.utcnow)
 
+class EmbeddingCache(Base):
+    """Cache persistente de embeddings endereçado pelo hash do conteúdo e pelo modelo."""
+    __tablename__ = 'embedding_cache'
+    __table_args__ = {'schema': ai_schema}
+
+    content_sha256 = Column(String(64), primary_key=True)
+    model = Column(String, primary_key=True)
+    embedding = Column(Vector(1536), nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class IngestionSourceState(Base):
+    """Validadores HTTP e hash do último download bem-sucedido de cada fonte (reingestão condicional)."""
+    __tablename__ = 'ingestion_source_state'
+    __table_args__ = {'schema': ai_schema}
+
+    namespace = Column(String, primary_key=True)
+    source_uri = Column(String, primary_key=True)
+    etag = Column(String)
+    last_modified = Column(String)
+    # SHA256 dos bytes brutos baixados
+    content_sha256 = Column(String(64), nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class SemanticAnswerCache(Base):
+    """Respostas já geradas, reutilizadas para perguntas semanticamente equivalentes."""
+    __tablename__ = 'semantic_answer_cache'
+    __table_args__ = (
+        Index(
+            'ix_ai_semantic_answer_cache_embedding_hnsw',
+            'embedding',
+            postgresql_using='hnsw',
+            postgresql_with={'m': 16, 'ef_construction': 64},
+            postgresql_ops={'embedding': 'vector_cosine_ops'},
+        ),
+        {'schema': ai_schema},
+    )
+
+    id = Column(Integer, primary_key=True)
+    # Namespace consultado ao gerar a resposta ('*' = todos os namespaces)
+    namespace = Column(String, nullable=False, index=True)
+    query_text = Column(Text, nullable=False)
+    embedding = Column(Vector(1536), nullable=False)
+    chunk_ids = Column(postgresql.ARRAY(Integer), nullable=False)
+    # SHA256 do conteúdo dos chunks citados: a entrada vale enquanto todos existirem
+    chunk_hashes = Column(postgresql.ARRAY(String(64)), nullable=False)
+    answer = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False)
+
 class Clients(Base):
     __tablename__ = 'clients'
     __table_args__ = {'schema': crm_schema}
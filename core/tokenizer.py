@@ -0,0 +1,13 @@
+import tiktoken
+
+# Encodings do tiktoken já carregados (compartilhados por chunking, lotes de embeddings e prompts)
+_encoding_cache = {}
+
+
+def get_encoding(encoding_name: str):
+    """
+    Retorna (e mantém em cache) o encoding do tiktoken informado
+    """
+    if encoding_name not in _encoding_cache:
+        _encoding_cache[encoding_name] = tiktoken.get_encoding(encoding_name)
+    return _encoding_cache[encoding_name]
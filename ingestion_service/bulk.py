@@ -0,0 +1,125 @@
+import codecs
+import json
+import logging
+from typing import AsyncIterable, AsyncIterator, Iterable, List, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.config import BULK_INGEST_MAX_ITEMS
+
+log = logging.getLogger(__name__)
+
+
+class BulkIngestionError(ValueError):
+    """Erro de validação no conteúdo enviado para a ingestão em massa."""
+
+
+async def iter_lines(chunks: AsyncIterable[bytes]) -> AsyncIterator[str]:
+    """
+    Converte o corpo recebido em pedaços (streaming) em linhas de texto UTF-8
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    buffer = ""
+    async for chunk in chunks:
+        buffer += decoder.decode(chunk)
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            yield line
+    buffer += decoder.decode(b"", final=True)
+    if buffer:
+        yield buffer
+
+
+async def iter_json_items(source_uris: Iterable[str], namespace: str) -> AsyncIterator[Tuple[int, str, str]]:
+    """
+    Converte a lista de URIs do corpo JSON em registros (ordem, source_uri, namespace)
+    """
+    for position, source_uri in enumerate(source_uris):
+        yield position, source_uri, namespace
+
+
+async def iter_ndjson_items(lines: AsyncIterable[str], default_namespace: str) -> AsyncIterator[Tuple[int, str, str]]:
+    """
+    Lê um corpo NDJSON linha a linha ({"source_uri": ..., "namespace": ...} por linha)
+    sem carregar o upload inteiro em memória
+    """
+    position = 0
+    line_number = 0
+    async for line in lines:
+        line_number += 1
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            item = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise BulkIngestionError(f"Linha {line_number}: JSON inválido ({e.msg})")
+        if not isinstance(item, dict) or not isinstance(item.get("source_uri"), str) or not item["source_uri"]:
+            raise BulkIngestionError(f"Linha {line_number}: campo 'source_uri' ausente ou inválido")
+        yield position, item["source_uri"], item.get("namespace") or default_namespace
+        position += 1
+
+
+async def _limited(records: AsyncIterable[Tuple[int, str, str]], counter: List[int]) -> AsyncIterator[Tuple[int, str, str]]:
+    """
+    Conta os registros recebidos e aplica o limite de itens por requisição
+    """
+    async for record in records:
+        counter[0] += 1
+        if counter[0] > BULK_INGEST_MAX_ITEMS:
+            raise BulkIngestionError(f"Limite de {BULK_INGEST_MAX_ITEMS} itens por requisição excedido")
+        yield record
+
+
+async def bulk_insert_jobs(session: AsyncSession, records: AsyncIterable[Tuple[int, str, str]]) -> dict:
+    """
+    Insere jobs de ingestão em massa numa única transação:
+    1. COPY dos registros para uma tabela temporária (em streaming);
+    2. INSERT ... SELECT para ai.ingestion_queue, ignorando URIs repetidas na
+       requisição e URIs já enfileiradas (PENDING/PROCESSING) no mesmo namespace.
+    Não faz commit; retorna os IDs criados e as contagens.
+    """
+    await session.execute(text(
+        "CREATE TEMP TABLE tmp_bulk_ingest (ord bigint, source_uri text, namespace text) ON COMMIT DROP"
+    ))
+
+    # COPY via driver asyncpg (aceita um iterável assíncrono de tuplas)
+    connection = await session.connection()
+    raw_connection = await connection.get_raw_connection()
+    received = [0]
+    await raw_connection.driver_connection.copy_records_to_table(
+        'tmp_bulk_ingest',
+        records=_limited(records, received),
+        columns=['ord', 'source_uri', 'namespace'],
+    )
+
+    result = await session.execute(text("""
+        INSERT INTO ai.ingestion_queue (source_uri, namespace, status, created_at, updated_at, dispatched_at)
+        SELECT t.source_uri, t.namespace, 'PENDING'::ai.ingestionstatus,
+               timezone('utc', now()), timezone('utc', now()), timezone('utc', now())
+        FROM (
+            SELECT DISTINCT ON (namespace, source_uri) ord, source_uri, namespace
+            FROM tmp_bulk_ingest
+            ORDER BY namespace, source_uri, ord
+        ) t
+        WHERE NOT EXISTS (
+            SELECT 1 FROM ai.ingestion_queue q
+            WHERE q.namespace = t.namespace
+              AND q.source_uri = t.source_uri
+              AND q.status IN ('PENDING', 'PROCESSING')
+        )
+        ORDER BY t.ord
+        RETURNING id
+    """))
+    job_ids = sorted(result.scalars().all())
+
+    log.info(f"Ingestão em massa: {received[0]} recebidos, {len(job_ids)} jobs criados")
+    return {
+        "received": received[0],
+        "inserted": len(job_ids),
+        "skipped": received[0] - len(job_ids),
+        "first_job_id": job_ids[0] if job_ids else None,
+        "last_job_id": job_ids[-1] if job_ids else None,
+        "job_ids": job_ids,
+    }
@@ -1,12 +1,15 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Request, BackgroundTasks
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 from datetime import datetime
+import asyncio
 import logging
 
-from ingestion_service.schemas import IngestionRequest, IngestionResponse
+from ingestion_service.schemas import IngestionRequest, IngestionResponse, BulkIngestionRequest, BulkIngestionResponse
+from ingestion_service.bulk import BulkIngestionError, bulk_insert_jobs, iter_json_items, iter_lines, iter_ndjson_items
 from core.database import get_db
 from core.models import IngestionQueue, PyIngestionStatus
+from core.celery_app import enqueue_ingestion_job, enqueue_ingestion_jobs
 
 log = logging.getLogger(__name__)
 
@@ -27,13 +30,16 @@ async def create_ingestion_job(
 ):
     """
     Endpoint para criar uma nova tarefa de ingestão.
-    Apenas insere na tabela 'ai.ingestion_queue' e retorna imediatamente.
+    Insere na tabela 'ai.ingestion_queue' e, após o commit, enfileira o
+    processamento diretamente no Celery, retornando imediatamente.
     """
     # Cria uma nova instância de IngestionQueue com status inicial PyIngestionStatus.PENDING
     new_job = IngestionQueue(
         source_uri=request_data.source_uri,
         namespace=request_data.namespace,
-        status=PyIngestionStatus.PENDING
+        status=PyIngestionStatus.PENDING,
+        # O despacho logo após o commit já conta como reivindicação do envio
+        dispatched_at=datetime.utcnow()
     )
 
     try:
@@ -43,9 +49,6 @@ async def create_ingestion_job(
         await session.commit()
         # Atualiza o objeto com os dados recém-inseridos (como o ID)
         await session.refresh(new_job)
-
-        # Retorna os dados do novo job criado
-        return new_job
     except IntegrityError as e:
         log.error(f"API: Erro de integridade (constraint violation): {e}", exc_info=True)
         raise HTTPException(status_code=400, detail="Erro de integridade: job duplicado ou constraint violada.")
@@ -56,6 +59,66 @@ async def create_ingestion_job(
         log.error(f"API: Erro inesperado durante operação: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Erro interno ao salvar o job no banco de dados.")
 
+    # Despachar o job (somente após o commit, para o worker enxergá-lo).
+    # Se o broker estiver indisponível, o job continua PENDING e será reenfileirado pelo varredor.
+    try:
+        await asyncio.to_thread(enqueue_ingestion_job, new_job.id)
+    except Exception as e:
+        log.warning(f"API: Falha ao enfileirar job {new_job.id}; o varredor fará o despacho: {e}")
+
+    # Retorna os dados do novo job criado
+    return new_job
+
+
+async def _run_bulk_ingestion(records, session: AsyncSession, background_tasks: BackgroundTasks) -> dict:
+    """
+    Executa a inserção em massa, commita e agenda o despacho dos jobs criados
+    """
+    try:
+        result = await bulk_insert_jobs(session, records)
+        await session.commit()
+    except BulkIngestionError as e:
+        await session.rollback()
+        raise HTTPException(status_code=400, detail=str(e))
+    except SQLAlchemyError as e:
+        log.error(f"API: Erro do SQLAlchemy durante ingestão em massa: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Erro de banco de dados ao salvar os jobs.")
+
+    # Despachar após a resposta; jobs não despachados são recuperados pelo varredor
+    if result["job_ids"]:
+        background_tasks.add_task(enqueue_ingestion_jobs, result["job_ids"])
+    return result
+
+
+@router.post('/ingest/bulk', response_model=BulkIngestionResponse, status_code=201)
+async def create_bulk_ingestion_jobs(
+    request_data: BulkIngestionRequest,
+    background_tasks: BackgroundTasks,
+    session: AsyncSession = Depends(get_db)
+):
+    """
+    Endpoint para criar vários jobs de ingestão de uma vez (lista JSON de URIs).
+    URIs repetidas ou já enfileiradas no mesmo namespace são ignoradas.
+    """
+    records = iter_json_items(request_data.source_uris, request_data.namespace)
+    return await _run_bulk_ingestion(records, session, background_tasks)
+
+
+@router.post('/ingest/bulk/ndjson', response_model=BulkIngestionResponse, status_code=201)
+async def create_bulk_ingestion_jobs_ndjson(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    namespace: str = "default",
+    session: AsyncSession = Depends(get_db)
+):
+    """
+    Endpoint para ingestão em massa via upload NDJSON (uma linha
+    {"source_uri": ..., "namespace": ...} por job), processado em streaming
+    direto para o COPY do Postgres. `namespace` é o padrão para linhas sem namespace.
+    """
+    records = iter_ndjson_items(iter_lines(request.stream()), namespace)
+    return await _run_bulk_ingestion(records, session, background_tasks)
+
 
 # Inclui as rotas definidas no roteador
 app.include_router(router)
@@ -1,6 +1,6 @@
 from pydantic import BaseModel
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
 
 
 class IngestionRequest(BaseModel):
@@ -14,4 +14,18 @@ class IngestionResponse(BaseModel):
     namespace: str
     status: str
     created_at: datetime
-    updated_at: Optional[datetime] = None
\ No newline at end of file
+    updated_at: Optional[datetime] = None
+
+
+class BulkIngestionRequest(BaseModel):
+    source_uris: List[str]
+    namespace: str = "default"
+
+
+class BulkIngestionResponse(BaseModel):
+    received: int
+    inserted: int
+    skipped: int
+    # Faixa de IDs criados (pode conter lacunas se houver inserções concorrentes)
+    first_job_id: Optional[int] = None
+    last_job_id: Optional[int] = None
@@ -0,0 +1,158 @@
+import json
+import logging
+import os
+import re
+from typing import List, Optional
+
+import openai
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.cache import LRUTTLCache
+from core.config import (
+    EMBEDDING_MODEL,
+    QUERY_EMBEDDING_CACHE_SIZE,
+    QUERY_EMBEDDING_CACHE_TTL_SECONDS,
+    QUERY_EMBEDDING_REDIS_URL,
+)
+from core.embedding_cache import content_hash, get_cached_embeddings, store_embeddings
+
+# Configuração do logger
+log = logging.getLogger(__name__)
+
+# Cache L1: em memória, por processo
+query_embedding_cache = LRUTTLCache(
+    maxsize=QUERY_EMBEDDING_CACHE_SIZE,
+    ttl_seconds=QUERY_EMBEDDING_CACHE_TTL_SECONDS,
+)
+
+# Contadores das camadas seguintes (Redis, Postgres e chamadas à OpenAI)
+_layer_stats = {"redis_hits": 0, "db_hits": 0, "api_calls": 0}
+
+_openai_client: Optional[openai.AsyncOpenAI] = None
+_redis_client = None
+
+
+def normalize_query(text: str) -> str:
+    """
+    Normaliza a query (caixa e espaços) para que variações triviais da mesma
+    pergunta compartilhem a mesma entrada de cache
+    """
+    return re.sub(r"\s+", " ", text).strip().casefold()
+
+
+def _get_openai_client() -> openai.AsyncOpenAI:
+    global _openai_client
+    if _openai_client is None:
+        openai_api_key = os.getenv("OPENAI_API_KEY")
+        if not openai_api_key:
+            raise Exception("OPENAI_API_KEY não encontrada nas variáveis de ambiente")
+        _openai_client = openai.AsyncOpenAI(api_key=openai_api_key)
+    return _openai_client
+
+
+def _get_redis_client():
+    """
+    Cliente Redis (cache L2, compartilhado entre processos). Desabilitado se
+    QUERY_EMBEDDING_REDIS_URL não estiver configurada.
+    """
+    global _redis_client
+    if _redis_client is None and QUERY_EMBEDDING_REDIS_URL:
+        import redis.asyncio as redis
+        _redis_client = redis.from_url(QUERY_EMBEDDING_REDIS_URL)
+    return _redis_client
+
+
+async def get_query_embedding(text: str, session: AsyncSession) -> list[float]:
+    """
+    Gera o embedding da query consultando, em ordem: o cache em memória,
+    o Redis (opcional), o cache persistente (ai.embedding_cache) e, por fim,
+    a API da OpenAI. Um embedding novo é gravado na sessão informada e
+    persiste no próximo commit.
+    """
+    normalized = normalize_query(text)
+    text_sha = content_hash(normalized)
+
+    embedding = query_embedding_cache.get(text_sha)
+    if embedding is not None:
+        return embedding
+
+    redis_client = _get_redis_client()
+    redis_key = f"query_embedding:{EMBEDDING_MODEL}:{text_sha}"
+    if redis_client is not None:
+        try:
+            raw = await redis_client.get(redis_key)
+            if raw is not None:
+                embedding = json.loads(raw)
+                _layer_stats["redis_hits"] += 1
+                query_embedding_cache.set(text_sha, embedding)
+                return embedding
+        except Exception as e:
+            log.warning(f"Falha ao consultar cache de embeddings no Redis: {e}")
+
+    cached = await get_cached_embeddings(session, [text_sha], EMBEDDING_MODEL)
+    if text_sha in cached:
+        embedding = cached[text_sha]
+        _layer_stats["db_hits"] += 1
+    else:
+        response = await _get_openai_client().embeddings.create(
+            input=normalized,
+            model=EMBEDDING_MODEL
+        )
+        embedding = response.data[0].embedding
+        _layer_stats["api_calls"] += 1
+        await store_embeddings(session, {text_sha: embedding}, EMBEDDING_MODEL)
+
+    query_embedding_cache.set(text_sha, embedding)
+    if redis_client is not None:
+        try:
+            await redis_client.set(redis_key, json.dumps(embedding), ex=int(QUERY_EMBEDDING_CACHE_TTL_SECONDS))
+        except Exception as e:
+            log.warning(f"Falha ao gravar cache de embeddings no Redis: {e}")
+    return embedding
+
+
+async def get_query_embeddings(texts: List[str], session: AsyncSession) -> List[list[float]]:
+    """
+    Versão em lote de get_query_embedding (ex.: exemplos fixos no startup):
+    consulta o cache em memória e o persistente e gera todos os ausentes em
+    uma única chamada à OpenAI. Não usa o Redis.
+    """
+    normalized_by_sha = {content_hash(normalize_query(text)): normalize_query(text) for text in texts}
+    embeddings = {}
+    for text_sha in normalized_by_sha:
+        embedding = query_embedding_cache.get(text_sha)
+        if embedding is not None:
+            embeddings[text_sha] = embedding
+
+    missing = [text_sha for text_sha in normalized_by_sha if text_sha not in embeddings]
+    if missing:
+        cached = await get_cached_embeddings(session, missing, EMBEDDING_MODEL)
+        _layer_stats["db_hits"] += len(cached)
+        embeddings.update(cached)
+        missing = [text_sha for text_sha in missing if text_sha not in cached]
+
+    if missing:
+        response = await _get_openai_client().embeddings.create(
+            input=[normalized_by_sha[text_sha] for text_sha in missing],
+            model=EMBEDDING_MODEL
+        )
+        # A API informa a posição de cada resultado em `index`; não depender da ordem da lista
+        data = sorted(response.data, key=lambda item: item.index)
+        generated = {text_sha: item.embedding for text_sha, item in zip(missing, data)}
+        _layer_stats["api_calls"] += 1
+        await store_embeddings(session, generated, EMBEDDING_MODEL)
+        embeddings.update(generated)
+
+    for text_sha, embedding in embeddings.items():
+        query_embedding_cache.set(text_sha, embedding)
+    return [embeddings[content_hash(normalize_query(text))] for text in texts]
+
+
+def get_query_embedding_cache_stats() -> dict:
+    """
+    Estatísticas do cache de embeddings de query (para monitoramento)
+    """
+    stats = query_embedding_cache.stats()
+    stats.update(_layer_stats)
+    stats["redis_enabled"] = bool(QUERY_EMBEDDING_REDIS_URL)
+    return stats
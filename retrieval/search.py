@@ -0,0 +1,145 @@
+import logging
+from typing import List, Optional, Sequence
+
+import numpy as np
+from sqlalchemy import select, func, literal_column
+
+from core.config import RAG_HYBRID_CANDIDATES, RAG_RRF_K, RAG_MMR_LAMBDA
+from core.models import RagDocuments1536, RAG_FTS_CONFIG
+
+# Configuração do logger
+log = logging.getLogger(__name__)
+
+
+def maximal_marginal_relevance(
+    query_vector: Sequence[float],
+    candidate_vectors: Sequence[Sequence[float]],
+    k: int,
+    lambda_mult: float = RAG_MMR_LAMBDA,
+) -> List[int]:
+    """
+    Seleciona k candidatos por Maximal Marginal Relevance (vetorizado com NumPy):
+    a cada passo escolhe o candidato que maximiza
+    lambda * sim(query, c) - (1 - lambda) * max(sim(c, já selecionados)).
+    Retorna os índices selecionados, em ordem de seleção.
+    """
+    if len(candidate_vectors) == 0 or k <= 0:
+        return []
+
+    candidates = np.asarray(candidate_vectors, dtype=np.float32)
+    query = np.asarray(query_vector, dtype=np.float32)
+
+    # Normalizar para que o produto interno seja a similaridade de cosseno
+    candidates = candidates / np.maximum(np.linalg.norm(candidates, axis=1, keepdims=True), 1e-12)
+    query = query / max(float(np.linalg.norm(query)), 1e-12)
+
+    relevance = candidates @ query
+    pairwise = candidates @ candidates.T
+
+    selected = [int(np.argmax(relevance))]
+    redundancy = pairwise[selected[0]].copy()
+    while len(selected) < min(k, len(candidates)):
+        scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        scores[selected] = -np.inf
+        chosen = int(np.argmax(scores))
+        selected.append(chosen)
+        redundancy = np.maximum(redundancy, pairwise[chosen])
+    return selected
+
+
+def build_vector_statement(
+    query_vector: list,
+    namespace: Optional[str],
+    limit: int,
+    max_distance: Optional[float] = None,
+    include_embedding: bool = False,
+):
+    """
+    Busca puramente vetorial (distância de cosseno, usa o índice HNSW).
+    A distância é calculada uma única vez: o ORDER BY ... LIMIT usa o índice
+    e o limite de distância é aplicado sobre o resultado.
+    """
+    columns = [
+        RagDocuments1536.id,
+        RagDocuments1536.content,
+        RagDocuments1536.source_uri,
+        RagDocuments1536.embedding.cosine_distance(query_vector).label('distance')
+    ]
+    if include_embedding:
+        columns.append(RagDocuments1536.embedding.label('embedding'))
+    stmt = select(*columns)
+    
+    # Adicionar filtro de namespace (se fornecido)
+    if namespace:
+        stmt = stmt.filter(RagDocuments1536.namespace == namespace)
+    
+    # Ordenar e limitar
+    stmt = stmt.order_by('distance').limit(limit)
+
+    # Descartar resultados pouco relevantes sem recalcular a distância
+    if max_distance is not None:
+        nearest = stmt.subquery('nearest')
+        stmt = select(nearest).filter(nearest.c.distance <= max_distance).order_by(nearest.c.distance)
+    return stmt
+
+
+def build_hybrid_statement(
+    query_text: str,
+    query_vector: list,
+    namespace: Optional[str],
+    limit: int,
+    candidates: int = RAG_HYBRID_CANDIDATES,
+    rrf_k: int = RAG_RRF_K,
+    include_embedding: bool = False,
+):
+    """
+    Busca híbrida em uma única consulta: os candidatos da busca vetorial (HNSW)
+    e da busca textual (tsvector/GIN) são combinados por Reciprocal Rank Fusion,
+    score = 1/(k + rank_vetorial) + 1/(k + rank_textual)
+    """
+    distance = RagDocuments1536.embedding.cosine_distance(query_vector)
+    ts_query = func.websearch_to_tsquery(literal_column(f"'{RAG_FTS_CONFIG}'::regconfig"), query_text)
+    text_rank = func.ts_rank_cd(RagDocuments1536.content_tsv, ts_query)
+
+    # Candidatos vetoriais
+    vector_stmt = select(RagDocuments1536.id.label('id'), distance.label('distance'))
+    if namespace:
+        vector_stmt = vector_stmt.filter(RagDocuments1536.namespace == namespace)
+    vector_sub = vector_stmt.order_by(distance).limit(candidates).subquery('vector_sub')
+    vector_ranked = select(
+        vector_sub.c.id,
+        func.row_number().over(order_by=vector_sub.c.distance).label('rank')
+    ).cte('vector_candidates')
+
+    # Candidatos textuais (full-text search em português)
+    keyword_stmt = select(RagDocuments1536.id.label('id'), text_rank.label('text_rank')).filter(
+        RagDocuments1536.content_tsv.op('@@')(ts_query)
+    )
+    if namespace:
+        keyword_stmt = keyword_stmt.filter(RagDocuments1536.namespace == namespace)
+    keyword_sub = keyword_stmt.order_by(text_rank.desc()).limit(candidates).subquery('keyword_sub')
+    keyword_ranked = select(
+        keyword_sub.c.id,
+        func.row_number().over(order_by=keyword_sub.c.text_rank.desc()).label('rank')
+    ).cte('keyword_candidates')
+
+    # Fusão: um documento pode aparecer em uma ou nas duas listas
+    score = (
+        func.coalesce(1.0 / (rrf_k + vector_ranked.c.rank), 0.0)
+        + func.coalesce(1.0 / (rrf_k + keyword_ranked.c.rank), 0.0)
+    ).label('score')
+    fused = vector_ranked.join(keyword_ranked, vector_ranked.c.id == keyword_ranked.c.id, full=True)
+
+    columns = [
+        RagDocuments1536.id,
+        RagDocuments1536.content,
+        RagDocuments1536.source_uri,
+        distance.label('distance'),
+        score
+    ]
+    if include_embedding:
+        columns.append(RagDocuments1536.embedding.label('embedding'))
+
+    return select(*columns).select_from(
+        fused.join(RagDocuments1536, RagDocuments1536.id == func.coalesce(vector_ranked.c.id, keyword_ranked.c.id))
+    ).order_by(score.desc()).limit(limit)
@@ -0,0 +1,144 @@
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.config import RAG_TOP_K, RAG_MMR_FETCH_MULTIPLIER, RAG_MMR_LAMBDA
+from core.database import set_hnsw_ef_search
+from retrieval.query_embedding import get_query_embedding, get_query_embedding_cache_stats
+from retrieval.search import build_vector_statement, build_hybrid_statement, maximal_marginal_relevance
+
+# Configuração do logger
+log = logging.getLogger(__name__)
+
+
+@dataclass
+class RetrievalOptions:
+    namespace: Optional[str] = None
+    top_k: int = RAG_TOP_K
+    # "vector" ou "hybrid" (full-text + vetorial com RRF)
+    mode: str = 'vector'
+    # Distância de cosseno máxima (apenas no modo "vector"); None = sem limite
+    max_distance: Optional[float] = None
+    mmr: bool = False
+    mmr_lambda: Optional[float] = None
+    mmr_fetch_k: Optional[int] = None
+    ef_search: Optional[int] = None
+
+
+@dataclass
+class RetrievedChunk:
+    id: int
+    content: str
+    source_uri: Optional[str]
+    distance: float
+    score: Optional[float] = None
+
+
+@dataclass
+class RetrievalResult:
+    chunks: List[RetrievedChunk]
+    query_vector: List[float]
+    # Duração de cada etapa em milissegundos (embedding, search, rerank, total)
+    timings: Dict[str, float] = field(default_factory=dict)
+
+
+# Métricas agregadas do processo (para monitoramento)
+_stats = {
+    "requests": 0,
+    "requests_by_mode": {},
+    "empty_results": 0,
+    "total_ms": {"embedding": 0.0, "search": 0.0, "rerank": 0.0, "total": 0.0},
+}
+
+
+async def retrieve(session: AsyncSession, query: str, options: Optional[RetrievalOptions] = None) -> RetrievalResult:
+    """
+    Caminho único de retrieval usado pelo webhook do WhatsApp e pela API REST:
+    embedding da query (com cache), ajuste do HNSW, busca vetorial ou híbrida,
+    filtro de distância, rerank MMR opcional e instrumentação por etapa.
+    O embedding novo fica pendente na sessão; quem chama faz o commit.
+    """
+    options = options or RetrievalOptions()
+    timings = {}
+    started = time.perf_counter()
+
+    # Etapa 1: embedding da query (memória -> Redis -> Postgres -> OpenAI)
+    query_vector = await get_query_embedding(query, session)
+    timings["embedding"] = (time.perf_counter() - started) * 1000
+
+    # Etapa 2: busca (ANN), com mais candidatos quando houver rerank MMR
+    search_started = time.perf_counter()
+    await set_hnsw_ef_search(session, options.ef_search)
+    fetch_k = options.top_k
+    if options.mmr:
+        fetch_k = max(options.mmr_fetch_k or options.top_k * RAG_MMR_FETCH_MULTIPLIER, options.top_k)
+
+    if options.mode == 'hybrid':
+        stmt = build_hybrid_statement(
+            query, query_vector, options.namespace, limit=fetch_k,
+            include_embedding=options.mmr
+        )
+    else:
+        stmt = build_vector_statement(
+            query_vector, options.namespace, limit=fetch_k,
+            max_distance=options.max_distance, include_embedding=options.mmr
+        )
+    result = await session.execute(stmt)
+    rows = [row._mapping for row in result.all()]
+    timings["search"] = (time.perf_counter() - search_started) * 1000
+
+    # Etapa 3: rerank MMR (opcional)
+    rerank_started = time.perf_counter()
+    if options.mmr:
+        lambda_mult = RAG_MMR_LAMBDA if options.mmr_lambda is None else options.mmr_lambda
+        selected = maximal_marginal_relevance(
+            query_vector, [row['embedding'] for row in rows], options.top_k, lambda_mult
+        )
+        rows = [rows[index] for index in selected]
+    timings["rerank"] = (time.perf_counter() - rerank_started) * 1000
+    timings["total"] = (time.perf_counter() - started) * 1000
+
+    chunks = [
+        RetrievedChunk(
+            id=row['id'],
+            content=row['content'],
+            source_uri=row['source_uri'],
+            distance=float(row['distance']),
+            score=float(row['score']) if 'score' in row else None
+        )
+        for row in rows
+    ]
+
+    _record_stats(options.mode, timings, len(chunks))
+    log.info(
+        f"Retrieval ({options.mode}, namespace={options.namespace}): {len(chunks)} chunks em "
+        f"{timings['total']:.1f}ms (embedding={timings['embedding']:.1f}ms, "
+        f"busca={timings['search']:.1f}ms, rerank={timings['rerank']:.1f}ms)"
+    )
+    return RetrievalResult(chunks=chunks, query_vector=query_vector, timings=timings)
+
+
+def _record_stats(mode: str, timings: Dict[str, float], result_count: int) -> None:
+    _stats["requests"] += 1
+    _stats["requests_by_mode"][mode] = _stats["requests_by_mode"].get(mode, 0) + 1
+    if result_count == 0:
+        _stats["empty_results"] += 1
+    for stage, elapsed in timings.items():
+        _stats["total_ms"][stage] += elapsed
+
+
+def get_retrieval_stats() -> dict:
+    """
+    Estatísticas agregadas do retrieval (latência média por etapa e cache de embeddings)
+    """
+    requests = _stats["requests"]
+    return {
+        "requests": requests,
+        "requests_by_mode": dict(_stats["requests_by_mode"]),
+        "empty_results": _stats["empty_results"],
+        "avg_ms": {stage: (total / requests if requests else 0.0) for stage, total in _stats["total_ms"].items()},
+        "query_embedding_cache": get_query_embedding_cache_stats(),
+    }
@@ -0,0 +1,182 @@
+import logging
+from dataclasses import dataclass
+from typing import List, Optional
+
+from core.config import (
+    INGESTION_CHUNK_MAX_TOKENS,
+    INGESTION_CHUNK_OVERLAP_TOKENS,
+    INGESTION_CHUNK_ENCODING,
+)
+from core.tokenizer import get_encoding
+
+# Configuração do logger
+log = logging.getLogger(__name__)
+
+# Separador usado entre elementos ao montar o texto completo do documento
+ELEMENT_SEPARATOR = "\n\n"
+
+# Tipos de elemento do Unstructured que iniciam uma nova seção
+HEADING_ELEMENT_TYPES = {"Title", "Header"}
+
+
+@dataclass
+class DocumentChunk:
+    index: int
+    text: str
+    start_offset: int
+    end_offset: int
+    token_count: int
+    section: Optional[str] = None
+    page_number: Optional[int] = None
+
+    def to_metadata(self) -> dict:
+        """
+        Metadados do chunk a serem gravados em document_metadata
+        """
+        return {
+            "chunk_index": self.index,
+            "start_offset": self.start_offset,
+            "end_offset": self.end_offset,
+            "token_count": self.token_count,
+            "section": self.section,
+            "page_number": self.page_number,
+        }
+
+
+@dataclass
+class _Unit:
+    """Trecho indivisível (parágrafo ou janela de tokens) com offsets no texto completo."""
+    start: int
+    end: int
+    tokens: int
+    section: Optional[str]
+    page_number: Optional[int]
+
+
+def _split_oversized(text: str, base_offset: int, encoding, max_tokens: int, overlap_tokens: int,
+                     section: Optional[str], page_number: Optional[int], reserved_tokens: int = 0) -> List[_Unit]:
+    """
+    Quebra um elemento maior que a janela em janelas de tokens com sobreposição.
+    `reserved_tokens` reduz a primeira janela para que ela caiba junto do título que a precede.
+    """
+    tokens = encoding.encode(text)
+    _, offsets = encoding.decode_with_offsets(tokens)
+
+    units = []
+    window_start = 0
+    window_size = max(max_tokens - reserved_tokens, overlap_tokens + 1)
+    while True:
+        window_end = min(window_start + window_size, len(tokens))
+        start = offsets[window_start]
+        end = offsets[window_end] if window_end < len(tokens) else len(text)
+        units.append(_Unit(base_offset + start, base_offset + end, window_end - window_start, section, page_number))
+        if window_end == len(tokens):
+            break
+        window_start = window_end - overlap_tokens
+        window_size = max_tokens
+    return units
+
+
+def build_full_text(elements: List[dict]) -> str:
+    """
+    Concatena o texto dos elementos do Unstructured (mesmo formato usado nos offsets dos chunks)
+    """
+    return ELEMENT_SEPARATOR.join(element.get("text", "") for element in elements if element.get("text"))
+
+
+def chunk_elements(
+    elements: List[dict],
+    max_tokens: int = INGESTION_CHUNK_MAX_TOKENS,
+    overlap_tokens: int = INGESTION_CHUNK_OVERLAP_TOKENS,
+    encoding_name: str = INGESTION_CHUNK_ENCODING,
+) -> List[DocumentChunk]:
+    """
+    Divide os elementos do Unstructured em chunks de até `max_tokens` tokens.
+
+    - Elementos de título (Title/Header) sempre iniciam um novo chunk e definem a seção corrente.
+    - Parágrafos são mantidos inteiros sempre que cabem na janela.
+    - Elementos maiores que a janela são quebrados em janelas de tokens com sobreposição.
+    - Chunks consecutivos da mesma seção compartilham até `overlap_tokens` tokens.
+
+    Os offsets são relativos ao texto retornado por `build_full_text(elements)`.
+    """
+    if overlap_tokens >= max_tokens:
+        raise ValueError("overlap_tokens deve ser menor que max_tokens")
+
+    encoding = get_encoding(encoding_name)
+    full_text = build_full_text(elements)
+    separator_tokens = len(encoding.encode(ELEMENT_SEPARATOR))
+
+    # Etapa 1: converter elementos em unidades com offsets no texto completo
+    units: List[_Unit] = []
+    section_breaks = set()
+    section = None
+    heading_tokens = 0
+    cursor = 0
+    for element in elements:
+        text = element.get("text")
+        if not text:
+            continue
+        page_number = (element.get("metadata") or {}).get("page_number")
+        is_heading = element.get("type") in HEADING_ELEMENT_TYPES
+        if is_heading:
+            section = text.strip()
+            section_breaks.add(len(units))
+
+        token_count = len(encoding.encode(text))
+        if token_count <= max_tokens:
+            units.append(_Unit(cursor, cursor + len(text), token_count, section, page_number))
+        else:
+            units.extend(_split_oversized(text, cursor, encoding, max_tokens, overlap_tokens, section, page_number,
+                                          reserved_tokens=heading_tokens))
+        # Tokens do título imediatamente anterior (para manter título e texto no mesmo chunk)
+        heading_tokens = token_count + separator_tokens if is_heading and token_count < max_tokens else 0
+        cursor += len(text) + len(ELEMENT_SEPARATOR)
+
+    # Etapa 2: agrupar unidades em chunks respeitando a janela e a sobreposição
+    chunks: List[DocumentChunk] = []
+    current: List[_Unit] = []
+    current_tokens = 0
+
+    def flush():
+        start, end = current[0].start, current[-1].end
+        chunks.append(DocumentChunk(
+            index=len(chunks),
+            text=full_text[start:end],
+            start_offset=start,
+            end_offset=end,
+            token_count=current_tokens,
+            section=current[0].section,
+            page_number=current[0].page_number,
+        ))
+
+    for position, unit in enumerate(units):
+        starts_section = position in section_breaks
+        needed = unit.tokens + (separator_tokens if current else 0)
+
+        if current and (starts_section or current_tokens + needed > max_tokens):
+            flush()
+            # Carregar as últimas unidades como sobreposição (apenas dentro da mesma seção)
+            carried: List[_Unit] = []
+            carried_tokens = 0
+            if not starts_section:
+                for previous in reversed(current):
+                    extra = previous.tokens + (separator_tokens if carried else 0)
+                    if carried_tokens + extra > overlap_tokens:
+                        break
+                    carried.insert(0, previous)
+                    carried_tokens += extra
+            # Não reaproveitar sobreposição se ela impedir a nova unidade de caber
+            if carried and carried_tokens + separator_tokens + unit.tokens > max_tokens:
+                carried, carried_tokens = [], 0
+            current, current_tokens = carried, carried_tokens
+            needed = unit.tokens + (separator_tokens if current else 0)
+
+        current.append(unit)
+        current_tokens += needed
+
+    if current:
+        flush()
+
+    log.info(f"Documento dividido em {len(chunks)} chunks (janela={max_tokens}, sobreposição={overlap_tokens})")
+    return chunks
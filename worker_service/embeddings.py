@@ -0,0 +1,144 @@
+import asyncio
+import logging
+import os
+from typing import List, Optional
+
+import openai
+
+from core.config import (
+    EMBEDDING_MODEL,
+    EMBEDDING_BATCH_MAX_INPUTS,
+    EMBEDDING_BATCH_MAX_TOKENS,
+    EMBEDDING_MAX_CONCURRENCY,
+    EMBEDDING_MAX_RETRIES,
+    INGESTION_CHUNK_ENCODING,
+)
+from core.tokenizer import get_encoding
+
+# Configuração do logger
+log = logging.getLogger(__name__)
+
+# Erros transitórios da OpenAI que justificam nova tentativa do lote
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APIConnectionError,
+    openai.APITimeoutError,
+    openai.InternalServerError,
+)
+
+
+class PartialEmbeddingError(Exception):
+    """
+    Um ou mais lotes falharam. `embeddings` mantém os vetores dos lotes
+    concluídos (None nas posições dos lotes que falharam), para que quem
+    chama possa gravá-los em cache antes de propagar o erro.
+    """
+
+    def __init__(self, message: str, embeddings: List[Optional[List[float]]]):
+        super().__init__(message)
+        self.embeddings = embeddings
+
+
+def build_batches(
+    texts: List[str],
+    max_inputs: int = EMBEDDING_BATCH_MAX_INPUTS,
+    max_tokens: int = EMBEDDING_BATCH_MAX_TOKENS,
+) -> List[List[int]]:
+    """
+    Agrupa os índices de `texts` em lotes que respeitam o limite de entradas
+    e o limite de tokens por requisição da API de embeddings
+    """
+    encoding = get_encoding(INGESTION_CHUNK_ENCODING)
+    batches: List[List[int]] = []
+    current: List[int] = []
+    current_tokens = 0
+
+    for index, text in enumerate(texts):
+        tokens = len(encoding.encode(text))
+        if current and (len(current) >= max_inputs or current_tokens + tokens > max_tokens):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(index)
+        current_tokens += tokens
+
+    if current:
+        batches.append(current)
+    return batches
+
+
+async def _embed_batch(
+    client: openai.AsyncOpenAI,
+    inputs: List[str],
+    model: str,
+    max_retries: int,
+) -> List[List[float]]:
+    """
+    Envia um lote para a API de embeddings, com retry exponencial em erros transitórios
+    """
+    attempt = 0
+    while True:
+        try:
+            response = await client.embeddings.create(input=inputs, model=model)
+            # A API informa o índice de cada entrada; não depender da ordem da resposta
+            ordered = sorted(response.data, key=lambda item: item.index)
+            return [item.embedding for item in ordered]
+        except RETRYABLE_ERRORS as e:
+            attempt += 1
+            if attempt > max_retries:
+                raise
+            delay = 2 ** (attempt - 1)
+            log.warning(f"Falha transitória no lote de {len(inputs)} embeddings ({e}). Tentativa {attempt}/{max_retries} em {delay}s")
+            await asyncio.sleep(delay)
+
+
+async def embed_texts(
+    texts: List[str],
+    model: str = EMBEDDING_MODEL,
+    client: Optional[openai.AsyncOpenAI] = None,
+    max_concurrency: int = EMBEDDING_MAX_CONCURRENCY,
+    max_retries: int = EMBEDDING_MAX_RETRIES,
+) -> List[List[float]]:
+    """
+    Gera embeddings para vários textos empacotando-os em lotes (uma chamada
+    `embeddings.create` por lote), com concorrência limitada entre lotes.
+    Cada lote é refeito de forma independente em caso de falha transitória,
+    então um erro pontual não obriga a refazer os lotes já concluídos.
+    Retorna os embeddings na mesma ordem de `texts`. Se algum lote falhar,
+    levanta PartialEmbeddingError com os vetores dos lotes que deram certo.
+    """
+    if not texts:
+        return []
+
+    owns_client = client is None
+    if owns_client:
+        openai_api_key = os.getenv("OPENAI_API_KEY")
+        if not openai_api_key:
+            raise Exception("OPENAI_API_KEY não encontrada nas variáveis de ambiente")
+        # Um único cliente (e pool de conexões) para todos os lotes do job
+        client = openai.AsyncOpenAI(api_key=openai_api_key, max_retries=0)
+
+    # Contagem de tokens (CPU) fora do loop de eventos compartilhado pelos jobs do processo
+    batches = await asyncio.to_thread(build_batches, texts)
+    semaphore = asyncio.Semaphore(max_concurrency)
+    embeddings: List[Optional[List[float]]] = [None] * len(texts)
+
+    async def run_batch(indices: List[int]):
+        async with semaphore:
+            vectors = await _embed_batch(client, [texts[i] for i in indices], model, max_retries)
+        for index, vector in zip(indices, vectors):
+            embeddings[index] = vector
+
+    log.info(f"Gerando {len(texts)} embeddings em {len(batches)} lote(s)")
+    try:
+        results = await asyncio.gather(*(run_batch(indices) for indices in batches), return_exceptions=True)
+    finally:
+        if owns_client:
+            await client.close()
+
+    errors = [result for result in results if isinstance(result, Exception)]
+    if errors:
+        raise PartialEmbeddingError(
+            f"Falha em {len(errors)} de {len(batches)} lote(s) de embeddings: {errors[0]}",
+            embeddings
+        )
+    return embeddings
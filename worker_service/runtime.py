@@ -0,0 +1,123 @@
+import asyncio
+import logging
+import threading
+from typing import Dict, Optional
+
+from celery.signals import worker_process_init, worker_process_shutdown, worker_shutdown
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker
+
+from core.config import (
+    INGESTION_DOWNLOAD_CONCURRENCY,
+    INGESTION_PARSE_CONCURRENCY,
+    INGESTION_EMBED_CONCURRENCY,
+)
+from core.database import build_async_engine, build_session_factory
+from core.http_clients import close_http_clients
+
+# Configuração do logger
+log = logging.getLogger(__name__)
+
+# PATTERN-001 (revisado): cada processo do worker mantém um único event loop,
+# executado em uma thread dedicada, e um engine com pool de conexões preso a ele
+# (assim como os clientes HTTP compartilhados de core/http_clients.py).
+# As tarefas do Celery (pool "threads" com N threads) apenas submetem corrotinas
+# a esse loop e aguardam o resultado, de modo que N jobs de ingestão ficam em
+# andamento ao mesmo tempo enquanto esperam download, Unstructured e OpenAI.
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_thread: Optional[threading.Thread] = None
+_engine: Optional[AsyncEngine] = None
+_session_maker: Optional[async_sessionmaker] = None
+_stage_semaphores: Dict[str, asyncio.Semaphore] = {}
+_lock = threading.Lock()
+
+# Limite de jobs simultâneos em cada etapa do pipeline (por processo)
+STAGE_LIMITS = {
+    "download": INGESTION_DOWNLOAD_CONCURRENCY,
+    "parse": INGESTION_PARSE_CONCURRENCY,
+    "embed": INGESTION_EMBED_CONCURRENCY,
+}
+
+
+def _reset_state():
+    global _loop, _loop_thread, _engine, _session_maker
+    _loop = None
+    _loop_thread = None
+    _engine = None
+    _session_maker = None
+    _stage_semaphores.clear()
+
+
+def get_worker_loop() -> asyncio.AbstractEventLoop:
+    """
+    Retorna o event loop persistente do processo, iniciando sua thread na primeira chamada
+    """
+    global _loop, _loop_thread
+    with _lock:
+        if _loop is None or _loop.is_closed():
+            _loop = asyncio.new_event_loop()
+            _loop_thread = threading.Thread(target=_loop.run_forever, name="ingestion-event-loop", daemon=True)
+            _loop_thread.start()
+    return _loop
+
+
+def run_async(coro):
+    """
+    Executa a corrotina no event loop persistente do processo e aguarda o resultado.
+    Pode ser chamada simultaneamente por várias threads do pool do Celery.
+    """
+    return asyncio.run_coroutine_threadsafe(coro, get_worker_loop()).result()
+
+
+def get_worker_session_maker() -> async_sessionmaker:
+    """
+    Retorna a fábrica de sessões do processo, criando o engine na primeira chamada.
+    Deve ser chamada de dentro do loop do worker (as conexões ficam presas a ele).
+    """
+    global _engine, _session_maker
+    if _session_maker is None:
+        _engine = build_async_engine()
+        _session_maker = build_session_factory(_engine)
+    return _session_maker
+
+
+def stage_semaphore(stage: str) -> asyncio.Semaphore:
+    """
+    Semáforo que limita quantos jobs executam a etapa `stage` ao mesmo tempo
+    """
+    if stage not in _stage_semaphores:
+        _stage_semaphores[stage] = asyncio.Semaphore(STAGE_LIMITS[stage])
+    return _stage_semaphores[stage]
+
+
+@worker_process_init.connect
+def _reset_worker_process_state(**kwargs):
+    """
+    Após o fork, descartar referências herdadas do processo pai
+    (threads, loop e conexões não podem ser compartilhados entre processos)
+    """
+    _reset_state()
+
+
+@worker_process_shutdown.connect
+@worker_shutdown.connect
+def _dispose_worker_process_state(**kwargs):
+    """
+    Fecha as conexões do pool e encerra o event loop do processo do worker
+    (worker_process_shutdown no pool prefork; worker_shutdown nos pools threads/solo)
+    """
+    loop = _loop
+    if loop is not None and not loop.is_closed():
+        try:
+            asyncio.run_coroutine_threadsafe(close_http_clients(), loop).result(timeout=10)
+        except Exception as e:
+            log.warning(f"Falha ao fechar os clientes HTTP do worker: {e}")
+        if _engine is not None:
+            try:
+                asyncio.run_coroutine_threadsafe(_engine.dispose(), loop).result(timeout=10)
+            except Exception as e:
+                log.warning(f"Falha ao liberar o pool de conexões do worker: {e}")
+        loop.call_soon_threadsafe(loop.stop)
+        if _loop_thread is not None:
+            _loop_thread.join(timeout=10)
+        loop.close()
+    _reset_state()
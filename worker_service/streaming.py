@@ -0,0 +1,164 @@
+import codecs
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from dataclasses import dataclass
+from typing import AsyncIterable, AsyncIterator, Optional
+
+import httpx
+
+from core.config import INGESTION_MAX_DOWNLOAD_BYTES, INGESTION_TEMP_DIR
+
+# Configuração do logger
+log = logging.getLogger(__name__)
+
+# Campos dos elementos do Unstructured usados pelo pipeline (o restante é descartado)
+ELEMENT_METADATA_FIELDS = ("page_number",)
+
+_json_decoder = json.JSONDecoder()
+
+
+class DownloadTooLargeError(Exception):
+    """O documento excede INGESTION_MAX_DOWNLOAD_BYTES."""
+
+
+@dataclass
+class DownloadResult:
+    # None quando o servidor respondeu 304 (não modificado)
+    path: Optional[str]
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    # SHA256 dos bytes baixados
+    content_sha256: Optional[str] = None
+
+    @property
+    def not_modified(self) -> bool:
+        return self.path is None
+
+
+async def download_to_tempfile(
+    client: httpx.AsyncClient,
+    url: str,
+    max_bytes: int = INGESTION_MAX_DOWNLOAD_BYTES,
+    etag: Optional[str] = None,
+    last_modified: Optional[str] = None,
+) -> DownloadResult:
+    """
+    Baixa o documento em streaming para um arquivo temporário, sem manter o
+    conteúdo em memória, abortando se ultrapassar `max_bytes` e calculando o
+    SHA256 dos bytes. Com `etag`/`last_modified` de um download anterior, faz
+    um GET condicional; se o servidor responder 304, nada é baixado.
+    Quem chama é responsável por remover o arquivo (DownloadResult.path).
+    """
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+
+    async with client.stream("GET", url, headers=headers) as response:
+        if response.status_code == 304:
+            log.info(f"{url} não modificado desde o último download (HTTP 304)")
+            return DownloadResult(path=None, etag=etag, last_modified=last_modified)
+        if response.status_code != 200:
+            raise Exception(f"Falha no download: {response.status_code}")
+
+        content_length = response.headers.get("Content-Length")
+        if content_length and content_length.isdigit() and int(content_length) > max_bytes:
+            raise DownloadTooLargeError(f"Documento de {content_length} bytes excede o limite de {max_bytes} bytes")
+
+        fd, path = tempfile.mkstemp(prefix="cogep_ingest_", dir=INGESTION_TEMP_DIR)
+        digest = hashlib.sha256()
+        try:
+            written = 0
+            with os.fdopen(fd, "wb") as file:
+                async for chunk in response.aiter_bytes():
+                    written += len(chunk)
+                    if written > max_bytes:
+                        raise DownloadTooLargeError(f"Documento excede o limite de {max_bytes} bytes")
+                    digest.update(chunk)
+                    file.write(chunk)
+        except BaseException:
+            os.unlink(path)
+            raise
+
+        result = DownloadResult(
+            path=path,
+            etag=response.headers.get("ETag"),
+            last_modified=response.headers.get("Last-Modified"),
+            content_sha256=digest.hexdigest(),
+        )
+
+    log.info(f"Download de {url} concluído ({written} bytes) em {path}")
+    return result
+
+
+def _slim_element(element: dict) -> dict:
+    """
+    Mantém apenas os campos usados pelo chunking, liberando o restante
+    (coordenadas, imagens em base64, etc.) assim que o elemento é lido
+    """
+    metadata = element.get("metadata") or {}
+    return {
+        "type": element.get("type"),
+        "text": element.get("text") or "",
+        "metadata": {field: metadata[field] for field in ELEMENT_METADATA_FIELDS if field in metadata},
+    }
+
+
+async def iter_json_array(chunks: AsyncIterable[bytes]) -> AsyncIterator[dict]:
+    """
+    Decodifica incrementalmente um array JSON recebido em pedaços, produzindo
+    cada elemento assim que ele está completo (sem carregar a resposta inteira)
+    """
+    buffer = ""
+    position = 0
+    started = False
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+    async for chunk in chunks:
+        buffer = buffer[position:] + decoder.decode(chunk)
+        position = 0
+        while True:
+            # Pular espaços, a abertura do array e separadores
+            while position < len(buffer) and buffer[position] in " \t\r\n,[":
+                if buffer[position] == "[":
+                    started = True
+                position += 1
+            if position >= len(buffer) or buffer[position] == "]":
+                break
+            if not started:
+                raise ValueError("Resposta do Unstructured não é um array JSON")
+            try:
+                element, end = _json_decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                # Elemento incompleto: aguardar o próximo pedaço
+                break
+            position = end
+            yield element
+
+    # Sem o "]" final o corpo foi truncado (ex.: conexão interrompida): não ingerir um documento parcial
+    remainder = (buffer[position:] + decoder.decode(b"", final=True)).strip()
+    if remainder != "]":
+        raise ValueError("Resposta do Unstructured terminou com JSON incompleto")
+
+
+async def iter_unstructured_elements(response: httpx.Response) -> AsyncIterator[dict]:
+    """
+    Lê os elementos de uma resposta do Unstructured em streaming, já reduzidos aos campos usados
+    """
+    async for element in iter_json_array(response.aiter_bytes()):
+        yield _slim_element(element)
+
+
+def remove_tempfile(path: Optional[str]) -> None:
+    """
+    Remove o arquivo temporário do download (ignorando se já não existir)
+    """
+    if path:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
@@ -1,20 +1,30 @@
 import asyncio
-import hashlib
-from datetime import datetime
+from datetime import datetime, timedelta
 import os
 import logging
-from sqlalchemy import pool
 
 import httpx
-import openai
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, update, delete, or_
 from sqlalchemy.dialects.postgresql import insert
 
 from celery import Celery
-import os
-from core.config import DATABASE_URL
-from core.models import IngestionQueue, RagDocuments1536, PyIngestionStatus
+from core.config import (
+    EMBEDDING_MODEL,
+    CELERY_WORKER_POOL,
+    CELERY_WORKER_CONCURRENCY,
+    INGESTION_SWEEPER_INTERVAL_SECONDS,
+    INGESTION_SWEEPER_BATCH_SIZE,
+    INGESTION_DISPATCH_STALE_SECONDS,
+    INGESTION_CONDITIONAL_FETCH,
+)
+from core.models import IngestionQueue, IngestionSourceState, RagDocuments1536, PyIngestionStatus
+from core.http_clients import get_http_client
+from core.embedding_cache import content_hash, get_cached_embeddings, store_embeddings
+from core.answer_cache import invalidate_namespace
+from worker_service.chunking import chunk_elements
+from worker_service.embeddings import embed_texts, PartialEmbeddingError
+from worker_service.streaming import download_to_tempfile, iter_unstructured_elements, remove_tempfile
+from worker_service.runtime import run_async, get_worker_session_maker, stage_semaphore
 
 # Configuração do logger
 log = logging.getLogger(__name__)
@@ -31,99 +41,83 @@ celery_app.conf.update(
     result_serializer='json',
     timezone='UTC',
     enable_utc=True,
+    # N threads submetem jobs ao event loop persistente do processo (ver worker_service/runtime.py)
+    worker_pool=CELERY_WORKER_POOL,
+    worker_concurrency=CELERY_WORKER_CONCURRENCY,
+    worker_prefetch_multiplier=1,
     worker_hijack_root_logger=False,
     worker_log_format='[%(asctime)s: %(levelname)s/%(processName)s] %(message)s',
     worker_task_log_format='[%(asctime)s: %(levelname)s/%(processName)s][%(task_name)s(%(task_id)s)] %(message)s'
 )
 
 # Função auxiliar para chamada da API de parsing Unstructured
-async def call_unstructured_api(content: bytes, filename: str = "document") -> str:
+async def call_unstructured_api(file_path: str, filename: str = "document") -> list:
     """
-    Faz chamada à API de parsing do Unstructured para obter o conteúdo textual do documento
+    Envia o documento à API de parsing do Unstructured em streaming a partir do
+    disco e lê os elementos (título, parágrafo, tabela...) incrementalmente,
+    mantendo apenas os campos usados e com o texto normalizado em UTF-8
     """
     unstructured_api_url = os.getenv("UNSTRUCTURED_API_URL")
     if not unstructured_api_url:
         raise Exception("UNSTRUCTURED_API_URL não encontrada nas variáveis de ambiente")
     
-    files = {'files': (filename, content)}
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.post(f"{unstructured_api_url}/general/v0/general", files=files)
-            response.raise_for_status() # Lança exceção para erros HTTP (4xx, 5xx)
-            parsed_elements = response.json()
-            # Processar 'parsed_elements' para extrair e concatenar o texto
-            full_text = "\n\n".join([element.get("text", "") for element in parsed_elements])
-            
-            # Garantir que o texto retornado está em formato UTF-8
-            # para evitar problemas de codificação nos estágios subsequentes
-            if isinstance(full_text, str):
-                full_text = full_text.encode('utf-8', errors='replace').decode('utf-8')
-            else:
-                full_text = str(full_text, 'utf-8', errors='replace')
-            
-            return full_text
-        except httpx.HTTPStatusError as e:
-            log.error(f"Erro HTTP ao chamar Unstructured API: {e.response.status_code} - {e.response.text}", exc_info=True)
-            raise Exception(f"Erro HTTP ao chamar Unstructured API: {e.response.status_code}")
-        except UnicodeDecodeError as e:
-            log.error(f"Erro de decodificação ao processar com Unstructured API: {e}", exc_info=True)
-            raise Exception(f"Erro de decodificação ao processar com Unstructured API: {e}")
-        except Exception as e:
-            log.error(f"Erro ao processar com Unstructured API: {e}", exc_info=True)
-            raise Exception(f"Erro ao processar com Unstructured API: {e}")
-
-
-# Função auxiliar para chamada da API de embeddings OpenAI
-async def call_openai_embedding(content: str) -> list:
-    """
-    Faz chamada à API de embeddings do OpenAI para gerar o embedding do conteúdo
-    """
-    openai_api_key = os.getenv("OPENAI_API_KEY")
-    if not openai_api_key:
-        raise Exception("OPENAI_API_KEY não encontrada nas variáveis de ambiente")
-    
-    client = openai.AsyncOpenAI(api_key=openai_api_key)
-    
-    response = await client.embeddings.create(
-        input=content,
-        model="text-embedding-3-small"  # Ou outro modelo de sua escolha
-    )
-    
-    return response.data[0].embedding
+    client = get_http_client("unstructured")
+    try:
+        with open(file_path, 'rb') as file:
+            files = {'files': (filename, file)}
+            async with client.stream('POST', f"{unstructured_api_url}/general/v0/general", files=files) as response:
+                if response.is_error:
+                    await response.aread()
+                response.raise_for_status() # Lança exceção para erros HTTP (4xx, 5xx)
+
+                parsed_elements = []
+                async for element in iter_unstructured_elements(response):
+                    # Garantir que o texto de cada elemento está em formato UTF-8
+                    # para evitar problemas de codificação nos estágios subsequentes
+                    element["text"] = element["text"].encode('utf-8', errors='replace').decode('utf-8')
+                    if element["text"]:
+                        parsed_elements.append(element)
+
+        return parsed_elements
+    except httpx.HTTPStatusError as e:
+        log.error(f"Erro HTTP ao chamar Unstructured API: {e.response.status_code} - {e.response.text}", exc_info=True)
+        raise Exception(f"Erro HTTP ao chamar Unstructured API: {e.response.status_code}")
+    except UnicodeDecodeError as e:
+        log.error(f"Erro de decodificação ao processar com Unstructured API: {e}", exc_info=True)
+        raise Exception(f"Erro de decodificação ao processar com Unstructured API: {e}")
+    except Exception as e:
+        log.error(f"Erro ao processar com Unstructured API: {e}", exc_info=True)
+        raise Exception(f"Erro ao processar com Unstructured API: {e}")
 
 
 @celery_app.task(name='tasks.process_ingestion_job')
 def process_ingestion_job(job_id: int):
-    # Executar a lógica assíncrona dentro de um loop de eventos
-    import asyncio
-    return asyncio.run(_process_ingestion_job_async(job_id))
+    # Executar a lógica assíncrona no loop de eventos do processo
+    return run_async(_process_ingestion_job_async(job_id))
 
 
 async def _process_ingestion_job_async(job_id: int):
     """
     Tarefa principal do worker para processar um job de ingestão.
-    Aplica o Engine-per-task (PATTERN-001) para gerenciar a conexão com o banco.
+    Usa o engine com pool do processo do worker (PATTERN-001 revisado).
     """
-    engine = None
+    session_maker = get_worker_session_maker()
+    doc_path = None
     try:
-        # PATTERN-001: Criar engine e sessionmaker locais para esta tarefa
-        engine = create_async_engine(
-            DATABASE_URL,
-            echo=True,
-            poolclass=pool.NullPool
-        )
-        session_maker = async_sessionmaker(
-            bind=engine,
-            autoflush=False,
-            autocommit=False,
-            expire_on_commit=False,
-        )
-
         async with session_maker() as session:
-            # Buscar o job no banco
-            job = await session.get(IngestionQueue, job_id)
+            # Reivindicar atomicamente o job: apenas um worker o move de PENDING para PROCESSING.
+            # Mensagens duplicadas (API + varredor) encontram o job já reivindicado e são descartadas.
+            result = await session.execute(
+                select(IngestionQueue)
+                .filter(
+                    IngestionQueue.id == job_id,
+                    IngestionQueue.status == PyIngestionStatus.PENDING
+                )
+                .with_for_update(skip_locked=True)
+            )
+            job = result.scalar_one_or_none()
             if not job:
-                log.warning(f"Job com ID {job_id} não encontrado")
+                log.info(f"Job com ID {job_id} não encontrado ou já reivindicado por outro worker")
                 return
 
             log.info(f"Processando job {job.id} de {job.source_uri}")
@@ -132,41 +126,162 @@ async def _process_ingestion_job_async(job_id: int):
             job.status = PyIngestionStatus.PROCESSING
             await session.commit()
             
-            # Download do conteúdo
-            async with httpx.AsyncClient() as client:
-                response = await client.get(job.source_uri)
-                if response.status_code != 200:
-                    raise Exception(f"Falha no download: {response.status_code}")
-                
-                doc_content = response.content
+            # Validadores do último download bem-sucedido desta fonte (reingestão condicional)
+            source_state = None
+            if INGESTION_CONDITIONAL_FETCH:
+                source_state = await session.get(IngestionSourceState, (job.namespace, job.source_uri))
+
+            # Download do conteúdo em streaming para um arquivo temporário (tamanho limitado)
+            async with stage_semaphore("download"):
+                download = await download_to_tempfile(
+                    get_http_client("download"), job.source_uri,
+                    etag=source_state.etag if source_state else None,
+                    last_modified=source_state.last_modified if source_state else None,
+                )
+            doc_path = download.path
+
+            # Fonte inalterada (HTTP 304 ou mesmos bytes): concluir sem parsing nem embeddings
+            if source_state and (download.not_modified or download.content_sha256 == source_state.content_sha256):
+                reason = "HTTP 304" if download.not_modified else "mesmo SHA256"
+                if not download.not_modified:
+                    source_state.etag = download.etag
+                    source_state.last_modified = download.last_modified
+                    source_state.updated_at = datetime.utcnow()
+                job.status = PyIngestionStatus.COMPLETED
+                job.processing_log = f"Fonte inalterada ({reason}); nada a processar"
+                job.updated_at = datetime.utcnow()
+                await session.commit()
+                log.info(f"Job {job.id}: fonte inalterada ({reason})")
+                return
 
             # Parsing do conteúdo
             # Extrair o nome do arquivo da URI para passar para a API do Unstructured
             filename = job.source_uri.split('/')[-1] or "document"
-            parsed_content = await call_unstructured_api(doc_content, filename)
+            async with stage_semaphore("parse"):
+                parsed_elements = await call_unstructured_api(doc_path, filename)
 
-            # Geração do hash SHA256 - garantir codificação UTF-8
-            content_sha = hashlib.sha256(parsed_content.encode('utf-8', errors='replace')).hexdigest()
+            # Chunking: dividir o documento em trechos limitados por tokens.
+            # Tokenização é CPU: roda em thread para não travar os demais jobs do loop
+            chunks = await asyncio.to_thread(chunk_elements, parsed_elements)
+            if not chunks:
+                raise Exception("Nenhum conteúdo textual extraído do documento")
 
-            # Gerar embedding - garantir que o conteúdo é uma string válida
-            embedding = await call_openai_embedding(parsed_content)
+            # Deduplicar chunks repetidos no mesmo documento, que violariam a constraint (namespace, source_uri, content_sha256)
+            unique_chunks = []
+            seen_hashes = set()
+            for chunk in chunks:
+                # Garantir que o conteúdo a ser salvo está em formato seguro
+                safe_content = chunk.text.encode('utf-8', errors='replace').decode('utf-8')
 
-            # Garantir que o conteúdo a ser salvo está em formato seguro
-            safe_content = parsed_content.encode('utf-8', errors='replace').decode('utf-8')
+                # Geração do hash SHA256 do chunk - garantir codificação UTF-8
+                content_sha = content_hash(safe_content)
+                if content_sha in seen_hashes:
+                    continue
+                seen_hashes.add(content_sha)
+                unique_chunks.append((chunk, safe_content, content_sha))
 
-            # Salvar no RAG DB
-            new_doc = RagDocuments1536(
-                namespace=job.namespace,
-                content=safe_content,
-                content_sha256=content_sha,
-                embedding=embedding,
-                document_metadata={'source_uri': job.source_uri}
+            # Ignorar chunks que esta fonte já tem no namespace (reingestão do mesmo conteúdo).
+            # Chunks iguais de outras fontes não contam: cada fonte é dona das suas linhas,
+            # para que a remoção de chunks obsoletos de uma não apague conteúdo da outra
+            result = await session.execute(
+                select(RagDocuments1536.content_sha256).filter(
+                    RagDocuments1536.namespace == job.namespace,
+                    RagDocuments1536.source_uri == job.source_uri,
+                    RagDocuments1536.content_sha256.in_(seen_hashes)
+                )
             )
-            
-            session.add(new_doc)
-            
+            existing_hashes = set(result.scalars().all())
+            new_chunks = [item for item in unique_chunks if item[2] not in existing_hashes]
+
+            # Consultar o cache de embeddings antes de chamar a OpenAI
+            embeddings_by_hash = await get_cached_embeddings(session, [sha for _, _, sha in new_chunks], EMBEDDING_MODEL)
+            missing = [(safe_content, sha) for _, safe_content, sha in new_chunks if sha not in embeddings_by_hash]
+            log.info(
+                f"Job {job.id}: {len(chunks)} chunks, {len(existing_hashes)} já existentes, "
+                f"{len(new_chunks) - len(missing)} embeddings em cache, {len(missing)} a gerar"
+            )
+
+            # Gerar em lotes apenas os embeddings ausentes e gravá-los no cache
+            if missing:
+                async with stage_semaphore("embed"):
+                    try:
+                        generated = await embed_texts([safe_content for safe_content, _ in missing])
+                    except PartialEmbeddingError as e:
+                        # Gravar os lotes concluídos (em sessão própria, pois a do job será
+                        # descartada) para que a nova tentativa não pague por eles de novo
+                        partial = {
+                            sha: embedding
+                            for (_, sha), embedding in zip(missing, e.embeddings)
+                            if embedding is not None
+                        }
+                        if partial:
+                            try:
+                                async with session_maker() as cache_session:
+                                    await store_embeddings(cache_session, partial, EMBEDDING_MODEL)
+                                    await cache_session.commit()
+                                log.info(f"Job {job.id}: {len(partial)} embeddings de lotes concluídos gravados no cache")
+                            except Exception as cache_error:
+                                log.warning(f"Job {job.id}: falha ao gravar embeddings parciais no cache: {cache_error}")
+                        raise
+                generated_by_hash = {sha: embedding for (_, sha), embedding in zip(missing, generated)}
+                await store_embeddings(session, generated_by_hash, EMBEDDING_MODEL)
+                embeddings_by_hash.update(generated_by_hash)
+
+            # Salvar no RAG DB (um registro por chunk)
+            for chunk, safe_content, content_sha in new_chunks:
+                metadata = {'source_uri': job.source_uri, 'chunk_count': len(chunks)}
+                metadata.update(chunk.to_metadata())
+                session.add(RagDocuments1536(
+                    namespace=job.namespace,
+                    source_uri=job.source_uri,
+                    content=safe_content,
+                    content_sha256=content_sha,
+                    embedding=embeddings_by_hash[content_sha],
+                    document_metadata=metadata
+                ))
+
+            # Remover os chunks desta fonte que não existem mais na versão atual (mesma transação)
+            result = await session.execute(
+                delete(RagDocuments1536)
+                .filter(
+                    RagDocuments1536.namespace == job.namespace,
+                    RagDocuments1536.source_uri == job.source_uri,
+                    RagDocuments1536.content_sha256.not_in(seen_hashes)
+                )
+                .returning(RagDocuments1536.id)
+                .execution_options(synchronize_session=False)
+            )
+            removed_count = len(result.scalars().all())
+
+            # Conteúdo do namespace mudou: respostas em cache podem estar desatualizadas
+            if new_chunks or removed_count:
+                await invalidate_namespace(session, job.namespace)
+
+            # Registrar os validadores deste download para a próxima reingestão
+            if INGESTION_CONDITIONAL_FETCH:
+                await session.execute(insert(IngestionSourceState).values(
+                    namespace=job.namespace,
+                    source_uri=job.source_uri,
+                    etag=download.etag,
+                    last_modified=download.last_modified,
+                    content_sha256=download.content_sha256,
+                    updated_at=datetime.utcnow(),
+                ).on_conflict_do_update(
+                    index_elements=['namespace', 'source_uri'],
+                    set_={
+                        'etag': download.etag,
+                        'last_modified': download.last_modified,
+                        'content_sha256': download.content_sha256,
+                        'updated_at': datetime.utcnow(),
+                    }
+                ))
+
             # Atualizar status para COMPLETED
             job.status = PyIngestionStatus.COMPLETED
+            job.processing_log = (
+                f"{len(new_chunks)} chunks inseridos, {len(existing_hashes)} já existentes, "
+                f"{removed_count} removidos"
+            )
             job.updated_at = datetime.utcnow()
             
             await session.commit()
@@ -176,74 +291,68 @@ async def _process_ingestion_job_async(job_id: int):
         log.error(f"Erro ao processar job {job_id}: {str(e)}", exc_info=True)
         
         # Em caso de erro, criar nova sessão para atualizar o status
-        if engine:
-            async with async_sessionmaker(bind=engine)() as error_session:
-                job = await error_session.get(IngestionQueue, job_id)
-                if job:
-                    job.status = PyIngestionStatus.FAILED
-                    # Garantir que a mensagem de erro também é segura em termos de codificação
-                    error_message = str(e).encode('utf-8', errors='replace').decode('utf-8')
-                    job.processing_log = error_message
-                    job.updated_at = datetime.utcnow()
-                    await error_session.commit()
+        async with session_maker() as error_session:
+            job = await error_session.get(IngestionQueue, job_id)
+            if job:
+                job.status = PyIngestionStatus.FAILED
+                # Garantir que a mensagem de erro também é segura em termos de codificação
+                error_message = str(e).encode('utf-8', errors='replace').decode('utf-8')
+                job.processing_log = error_message
+                job.updated_at = datetime.utcnow()
+                await error_session.commit()
     finally:
-        # PATTERN-001: Dispor do engine para liberar recursos
-        if engine:
-            await engine.dispose()
+        remove_tempfile(doc_path)
 
 
 @celery_app.task(name='tasks.schedule_job_processor')
 def schedule_job_processor():
-    # Executar a lógica assíncrona dentro de um loop de eventos
-    import asyncio
-    return asyncio.run(_schedule_job_processor_async())
+    # Executar a lógica assíncrona no loop de eventos do processo
+    return run_async(_schedule_job_processor_async())
 
 
 async def _schedule_job_processor_async():
     """
-    Tarefa agendada para buscar e agendar jobs de ingestão.
-    Implementa o 'Feeder' que verifica por novos jobs.
+    Varredor agendado: reenfileira, em lotes, jobs PENDING nunca despachados ou
+    cujo despacho ficou obsoleto (dispatched_at há mais de
+    INGESTION_DISPATCH_STALE_SECONDS sem o job sair de PENDING).
+    O UPDATE ... FOR UPDATE SKIP LOCKED reivindica o reenvio, de modo que cada
+    job é reenviado no máximo uma vez por período, mesmo com varredores
+    concorrentes. O status e updated_at não são alterados aqui; a reivindicação
+    do processamento acontece em process_ingestion_job.
     """
-    engine = None
     try:
-        # PATTERN-001: Criar engine e sessionmaker locais para esta tarefa
-        engine = create_async_engine(
-            DATABASE_URL,
-            echo=True,
-            poolclass=pool.NullPool
-        )
-        session_maker = async_sessionmaker(
-            bind=engine,
-            autoflush=False,
-            autocommit=False,
-            expire_on_commit=False,
-        )
-
-        async with session_maker() as session:
-            # Reivindicar atomicamente um job pendente
-            result = await session.execute(
-                select(IngestionQueue)
-                .filter(IngestionQueue.status == PyIngestionStatus.PENDING)
-                .limit(1)
+        async with get_worker_session_maker()() as session:
+            now = datetime.utcnow()
+            stale_before = now - timedelta(seconds=INGESTION_DISPATCH_STALE_SECONDS)
+            candidates = (
+                select(IngestionQueue.id)
+                .filter(
+                    IngestionQueue.status == PyIngestionStatus.PENDING,
+                    or_(IngestionQueue.dispatched_at.is_(None), IngestionQueue.dispatched_at < stale_before)
+                )
+                .order_by(IngestionQueue.id)
+                .limit(INGESTION_SWEEPER_BATCH_SIZE)
                 .with_for_update(skip_locked=True)
+                .scalar_subquery()
             )
-            job = result.scalar_one_or_none()
+            result = await session.execute(
+                update(IngestionQueue)
+                .where(IngestionQueue.id.in_(candidates))
+                # Preservar updated_at (onupdate): ele registra mudanças de estado, não despachos
+                .values(dispatched_at=now, updated_at=IngestionQueue.updated_at)
+                .returning(IngestionQueue.id)
+            )
+            job_ids = sorted(result.scalars().all())
+            await session.commit()
 
-            if job:
-                # Atualizar status para PROCESSING
-                job.status = PyIngestionStatus.PROCESSING
-                await session.commit()
-                
-                # Agendar o processamento do job
-                process_ingestion_job.delay(job.id)
-                log.info(f"Job {job.id} reivindicado e agendado para processamento")
+            # Agendar o processamento dos jobs reivindicados
+            for job_id in job_ids:
+                process_ingestion_job.delay(job_id)
+            if job_ids:
+                log.info(f"{len(job_ids)} job(s) PENDING reenfileirado(s) pelo varredor")
 
     except Exception as e:
         log.error(f"Erro ao agendar processamento de job: {str(e)}", exc_info=True)
-    finally:
-        # PATTERN-001: Dispor do engine para liberar recursos
-        if engine:
-            await engine.dispose()
 
 
 # Configurar o Celery Beat para agendar tarefas periódicas
@@ -252,5 +361,5 @@ def setup_periodic_tasks(sender, **kwargs):
     """
     Configura tarefas periódicas para o Celery Beat
     """
-    # Agendar o schedule_job_processor para rodar a cada 10 segundos
-    sender.add_periodic_task(10.0, schedule_job_processor.s(), name='check for new jobs')
\ No newline at end of file
+    # Agendar o varredor de jobs PENDING (o despacho normal é feito pela API)
+    sender.add_periodic_task(INGESTION_SWEEPER_INTERVAL_SECONDS, schedule_job_processor.s(), name='sweep pending jobs')